@@ -0,0 +1,91 @@
+"""Control de admisión para el trabajo pesado (pandas) fuera del event loop.
+
+Cada carril tiene su propio ThreadPoolExecutor acotado, un límite de análisis
+simultáneos y una cola máxima de espera; si la cola está llena se responde 503 en
+lugar de acumular peticiones. Los libros grandes van a un carril aparte, así un
+libro enorme no deja sin hilos a las peticiones interactivas pequeñas.
+"""
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+
+FILAS_GRANDE = int(os.environ.get("FINANZAS_FILAS_GRANDE", "50000"))
+
+class ColaLlena(HTTPException):
+    def __init__(self, carril):
+        super().__init__(status_code=503, detail=f"Servidor ocupado ({carril}), intente de nuevo",
+                         headers={"Retry-After": "5"})
+
+class Carril:
+    def __init__(self, nombre, concurrencia, max_cola):
+        self.nombre = nombre
+        self.concurrencia = concurrencia
+        self.max_cola = max_cola
+        self.executor = ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix=f"analisis-{nombre}")
+        self.semaforo = None # se crea dentro del event loop
+        self.en_cola = 0
+        self.en_curso = 0
+        self.rechazadas = 0
+        self.completadas = 0
+
+    async def ejecutar(self, fn, *args, **kwargs):
+        """Espera turno (o rechaza si la cola está llena) y corre fn en el executor del carril.
+        La ContextVar de métricas viaja con la llamada."""
+        if self.semaforo is None:
+            self.semaforo = asyncio.Semaphore(self.concurrencia)
+        if self.en_cola >= self.max_cola:
+            self.rechazadas += 1
+            raise ColaLlena(self.nombre)
+        self.en_cola += 1
+        try:
+            await self.semaforo.acquire()
+        finally:
+            self.en_cola -= 1
+        self.en_curso += 1
+        try:
+            ctx = contextvars.copy_context()
+            llamada = functools.partial(ctx.run, fn, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, llamada)
+        finally:
+            self.en_curso -= 1
+            self.completadas += 1
+            self.semaforo.release()
+
+    def stats(self):
+        return {"concurrencia": self.concurrencia, "max_cola": self.max_cola, "en_cola": self.en_cola,
+                "en_curso": self.en_curso, "rechazadas": self.rechazadas, "completadas": self.completadas}
+
+    def cerrar(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+CARRILES = {
+    "interactivo": Carril(
+        "interactivo",
+        int(os.environ.get("FINANZAS_CONCURRENCIA", "0")) or os.cpu_count() or 1,
+        int(os.environ.get("FINANZAS_MAX_COLA", "64")),
+    ),
+    "grande": Carril(
+        "grande",
+        int(os.environ.get("FINANZAS_CONCURRENCIA_GRANDE", "1")),
+        int(os.environ.get("FINANZAS_MAX_COLA_GRANDE", "8")),
+    ),
+}
+
+def elegir_carril(filas):
+    return CARRILES["grande" if filas >= FILAS_GRANDE else "interactivo"]
+
+def exposicion_prometheus():
+    lineas = [
+        "# HELP finanzas_queue_depth Peticiones esperando turno por carril",
+        "# TYPE finanzas_queue_depth gauge",
+    ]
+    lineas += [f'finanzas_queue_depth{{lane="{n}"}} {c.en_cola}' for n, c in CARRILES.items()]
+    lineas += ["# HELP finanzas_in_flight Análisis en curso por carril", "# TYPE finanzas_in_flight gauge"]
+    lineas += [f'finanzas_in_flight{{lane="{n}"}} {c.en_curso}' for n, c in CARRILES.items()]
+    lineas += ["# HELP finanzas_rejected_total Peticiones rechazadas por cola llena", "# TYPE finanzas_rejected_total counter"]
+    lineas += [f'finanzas_rejected_total{{lane="{n}"}} {c.rechazadas}' for n, c in CARRILES.items()]
+    return "\n".join(lineas) + "\n"
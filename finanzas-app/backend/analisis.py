@@ -0,0 +1,100 @@
+"""Análisis vertical y horizontal calculados sobre columnas completas (sin iterrows)."""
+from arranque import diferido
+
+from razones import dividir
+
+np = diferido("numpy")
+pd = diferido("pandas")
+
+TIPOS_BALANCE = ['asset', 'liability', 'equity']
+
+def generar_analisis_vertical(df, statements, columnar=False):
+    """% de cada cuenta sobre su base del año: activo total para cuentas de balance,
+    ventas netas para resultados. Las bases salen de los totales de los estados y se
+    difunden sobre el DataFrame de cuentas en una sola operación."""
+    if df.empty: return {} if columnar else []
+
+    years = sorted(statements)
+    base_act = pd.Series({y: statements[y]['balance_sheet']['assets']['total'] for y in years}, dtype=float)
+    base_ven = pd.Series({y: statements[y]['income_statement']['net_sales'] for y in years}, dtype=float)
+
+    dfv = df.sort_values('year', kind='stable')
+    anios = dfv['year'].astype(int)
+    base = np.where(
+        dfv['type'].isin(TIPOS_BALANCE).to_numpy(),
+        anios.map(base_act).fillna(0).to_numpy(),
+        anios.map(base_ven).fillna(0).to_numpy(),
+    )
+    valores = dfv['value'].to_numpy(dtype=float)
+    pct = dividir(valores, base) * 100
+
+    dfv = dfv.assign(value=valores, year=anios, pct=pct)
+    if columnar:
+        return {col: dfv[col].tolist() for col in dfv.columns}
+    return dfv.to_dict('records')
+
+MODOS_HORIZONTAL = ('first', 'yoy', 'base')
+
+def matriz_cuentas(df):
+    """Cuentas x años con los valores sumados (equivalente al pivot_table original)"""
+    piv = df.groupby(['accountName', 'year'])['value'].sum().unstack('year', fill_value=0.0).sort_index()
+    return piv.index.tolist(), [int(y) for y in piv.columns], piv.to_numpy(dtype=float)
+
+def calcular_cagr(inicial, final, periodos):
+    """Tasa compuesta anual (%) por fila; 0 donde no está definida (base <= 0 o final < 0)"""
+    validos = (inicial > 0) & (final >= 0) & (periodos > 0)
+    cociente = dividir(final, inicial)
+    exponente = dividir(1, periodos)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tasa = np.where(validos, np.power(np.where(validos, cociente, 1.0), exponente) - 1, 0.0)
+    return tasa * 100
+
+def generar_analisis_horizontal(df, modo='first', base_year=None, columnar=False):
+    """Variaciones por cuenta calculadas sobre la matriz cuentas x años.
+    modo: 'first' (cada año vs el primero), 'yoy' (vs el año anterior) o
+    'base' (vs base_year). La forma columnar incluye además el CAGR por cuenta."""
+    if modo not in MODOS_HORIZONTAL:
+        raise ValueError(f"Modo horizontal inválido: {modo}")
+    cuentas, years, m = matriz_cuentas(df)
+    if len(years) < 2: return {} if columnar else []
+
+    if modo == 'yoy':
+        idx_base = np.arange(len(years) - 1)
+        idx_curr = np.arange(1, len(years))
+    else:
+        if modo == 'base':
+            if base_year not in years:
+                raise ValueError(f"El año base {base_year} no está en los datos")
+            b = years.index(base_year)
+        else:
+            b = 0
+        idx_curr = np.array([i for i in range(len(years)) if i != b])
+        idx_base = np.full(len(idx_curr), b)
+
+    val_base = m[:, idx_base]
+    val_curr = m[:, idx_curr]
+    var_abs = val_curr - val_base
+    var_pct = dividir(var_abs, val_base) * 100
+    periodos = [f"{years[c]} vs {years[b]}" for b, c in zip(idx_base, idx_curr)]
+
+    if columnar:
+        return {
+            "mode": modo,
+            "accounts": cuentas,
+            "periods": periodos,
+            "val_base": val_base.tolist(),
+            "val_curr": val_curr.tolist(),
+            "var_abs": var_abs.tolist(),
+            "var_pct": var_pct.tolist(),
+            "cagr": calcular_cagr(m[:, 0], m[:, -1], years[-1] - years[0]).tolist(),
+        }
+
+    n_cuentas, n_periodos = var_abs.shape
+    return pd.DataFrame({
+        "period": np.tile(np.array(periodos, dtype=object), n_cuentas),
+        "account": np.repeat(np.array(cuentas, dtype=object), n_periodos),
+        "val_base": val_base.ravel(),
+        "val_curr": val_curr.ravel(),
+        "var_abs": var_abs.ravel(),
+        "var_pct": var_pct.ravel(),
+    }).to_dict('records')
@@ -0,0 +1,129 @@
+"""Arranque del servicio: importaciones diferidas, calentamiento y plantilla de procesos.
+
+pandas y numpy se importan en el primer uso (ver diferido), así que importar main solo
+carga FastAPI y las tablas propias y el proceso puede escuchar antes. Al iniciar la app,
+un hilo ejecuta las etapas de calentamiento (importaciones, tablas de clasificación, un
+análisis de muestra, pools) y /ready responde 503 hasta que terminan.
+
+Los pools de procesos usan forkserver con PRECARGA: cada proceso nuevo se bifurca de
+esa plantilla, que ya importó pandas y main, en lugar de importar todo otra vez o de
+heredar los hilos del servidor con fork.
+"""
+import importlib
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger("finanzas")
+
+CALENTAR = os.environ.get("FINANZAS_CALENTAR", "1") == "1"
+CALENTAR_POOLS = os.environ.get("FINANZAS_CALENTAR_POOLS", "0") == "1"
+PRECARGA = ["numpy", "pandas", "main"]
+
+class ModuloDiferido:
+    """Se comporta como el módulo 'nombre' pero lo importa en el primer acceso a un atributo"""
+
+    def __init__(self, nombre):
+        self._nombre = nombre
+        self._modulo = None
+
+    def __getattr__(self, atributo):
+        modulo = self._modulo
+        if modulo is None:
+            # import_module ya serializa importaciones concurrentes del mismo módulo
+            modulo = self._modulo = importlib.import_module(self._nombre)
+        return getattr(modulo, atributo)
+
+    def __repr__(self):
+        return f"<módulo diferido '{self._nombre}'{' (importado)' if self._modulo is not None else ''}>"
+
+def diferido(nombre):
+    """pd = diferido("pandas") en lugar de import pandas as pd"""
+    return ModuloDiferido(nombre)
+
+def importados(nombres):
+    return {n: n in sys.modules for n in nombres}
+
+_contexto = None
+
+def contexto_procesos():
+    """mp_context de los ProcessPoolExecutor: forkserver con PRECARGA si la plataforma lo tiene"""
+    global _contexto
+    if _contexto is None:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            _contexto = multiprocessing.get_context("forkserver")
+            _contexto.set_forkserver_preload(PRECARGA)
+        else:
+            _contexto = multiprocessing.get_context()
+    return _contexto
+
+class Calentamiento:
+    """Ejecuta las etapas [(nombre, fn)] en un hilo de fondo y guarda su estado para /ready.
+    Una etapa que falla se registra y no bloquea las siguientes: el servicio sigue
+    pudiendo atender, solo que la primera petición pagará lo que faltó calentar."""
+
+    def __init__(self, etapas, activo=CALENTAR):
+        self.etapas = etapas
+        self.activo = activo
+        self.estado = "pendiente"
+        self.duraciones = {}
+        self.errores = {}
+        self.segundos = None
+        self._hilo = None
+        self._listo = threading.Event()
+
+    def iniciar(self):
+        if self._hilo is not None or self._listo.is_set():
+            return
+        if not self.activo:
+            self.estado = "desactivado"
+            self._listo.set()
+            return
+        self.estado = "calentando"
+        self._hilo = threading.Thread(target=self._ejecutar, name="calentamiento", daemon=True)
+        self._hilo.start()
+
+    def _ejecutar(self):
+        t0 = time.perf_counter()
+        for nombre, fn in self.etapas:
+            t = time.perf_counter()
+            try:
+                fn()
+            except Exception as e:
+                logger.exception("Error en la etapa de calentamiento '%s': %s", nombre, e)
+                self.errores[nombre] = str(e)
+            self.duraciones[nombre] = time.perf_counter() - t
+        self.segundos = time.perf_counter() - t0
+        self.estado = "listo"
+        self._listo.set()
+        logger.info("Calentamiento terminado en %.2f s", self.segundos)
+
+    def listo(self):
+        return self._listo.is_set()
+
+    def esperar(self, timeout=None):
+        return self._listo.wait(timeout)
+
+    def stats(self):
+        return {
+            "ready": self.listo(),
+            "estado": self.estado,
+            "segundos": self.segundos,
+            "etapas": {n: round(s * 1000, 2) for n, s in self.duraciones.items()},
+            "errores": self.errores,
+            "modulos": importados(PRECARGA[:-1]),
+        }
+
+    def exposicion_prometheus(self):
+        lineas = [
+            "# HELP finanzas_ready 1 cuando terminó el calentamiento de arranque",
+            "# TYPE finanzas_ready gauge",
+            f"finanzas_ready {int(self.listo())}",
+            "# HELP finanzas_warmup_seconds Duración de cada etapa del calentamiento",
+            "# TYPE finanzas_warmup_seconds gauge",
+        ]
+        lineas += [f'finanzas_warmup_seconds{{stage="{n}"}} {s}' for n, s in self.duraciones.items()]
+        return "\n".join(lineas) + "\n"
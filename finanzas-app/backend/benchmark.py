@@ -0,0 +1,197 @@
+"""Benchmark del pipeline de /analyze con libros contables sintéticos.
+
+Uso:
+    python benchmark.py --empresas 5 --years 10 --cuentas 80 --lineas 20 --repeticiones 3 --output benchmark.json
+
+Cada etapa se cronometra por separado y el resultado se guarda en JSON para poder
+comparar corridas (mismo --seed => mismos datos).
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import clasificador
+import main
+from analisis import generar_analisis_vertical, generar_analisis_horizontal
+
+# Nombres que cubren todas las ramas de clasificar_cuenta (y algunas cuentas de total)
+CUENTAS_BASE = {
+    'asset': [
+        'Caja General', 'Bancos Nacionales', 'Efectivo en Tránsito', 'Fondos Disponibles',
+        'Clientes Nacionales', 'Cuentas por Cobrar Comerciales', 'Deudores Diversos',
+        'Inventario de Mercaderías', 'Almacén de Materia Prima', 'Mercaderia en Tránsito', 'Existencias',
+        'Otros Activos Corrientes', 'Activo Circulante Diverso', 'Inversiones a Corto Plazo',
+        'Activo Fijo', 'Maquinaria Industrial', 'Edificios', 'Equipo de Cómputo', 'Terrenos',
+        'Vehiculos de Reparto', 'Propiedad de Inversión', 'Intangibles', 'Patentes y Marcas',
+    ],
+    'liability': [
+        'Proveedores Locales', 'Cuentas por Pagar', 'Acreedores Diversos',
+        'Pasivo Corriente Diverso', 'Préstamo Bancario Corto Plazo',
+        'Préstamo Bancario Largo Plazo', 'Bonos Emitidos', 'Hipotecas',
+    ],
+    'equity': ['Capital Social', 'Reserva Legal', 'Aportes Adicionales'],
+    'revenue': ['Ingresos por Servicios', 'Ventas de Mercadería', 'Otros Ingresos'],
+    'expense': [
+        'Costo de Ventas', 'Costo de Producción', 'Gastos Financieros', 'Intereses Bancarios',
+        'Impuesto sobre la Renta', 'Impuestos Municipales', 'Depreciación de Activos',
+        'Amortización de Intangibles', 'Gastos de Administración', 'Sueldos y Salarios',
+        'Publicidad', 'Alquileres',
+    ],
+}
+CUENTAS_TOTAL = [('Total Activos', 'asset'), ('Suma del Pasivo', 'liability'),
+                 ('Utilidad Neta', 'revenue'), ('Resultado del Ejercicio', 'equity')]
+# Orden de magnitud de los saldos por tipo
+ESCALA = {'asset': 50_000, 'liability': 30_000, 'equity': 80_000, 'revenue': 400_000, 'expense': 40_000}
+
+def generar_cuentas(rng, n_cuentas):
+    """Catálogo de n_cuentas (nombre, tipo): primero las base, luego variantes por sucursal"""
+    base = [(n, t) for t, nombres in CUENTAS_BASE.items() for n in nombres]
+    cuentas = list(base)
+    i = 1
+    while len(cuentas) < n_cuentas:
+        nombre, tipo = rng.choice(base)
+        cuentas.append((f"{nombre} Sucursal {i}", tipo))
+        i += 1
+    return cuentas[:max(n_cuentas, 1)] + CUENTAS_TOTAL
+
+def generar_libro(empresas=1, years=5, cuentas=60, lineas=1, seed=42, year_inicial=2015):
+    """Devuelve {company_id: DataFrame} con el formato de FinancialRecord.
+    'lineas' es el número de asientos por cuenta y año (se suman en el análisis)."""
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    libros = {}
+    for e in range(empresas):
+        catalogo = generar_cuentas(rng, cuentas)
+        nombres = np.array([n for n, _ in catalogo], dtype=object)
+        tipos = np.array([t for _, t in catalogo], dtype=object)
+        escala = np.array([ESCALA[t] for t in tipos]) * np_rng.uniform(0.2, 1.5, len(catalogo))
+        # Crecimiento anual aleatorio por cuenta (paseo aleatorio multiplicativo)
+        crecimiento = np.cumprod(1 + np_rng.normal(0.05, 0.12, (years, len(catalogo))), axis=0)
+        saldos = escala * crecimiento
+
+        n_filas = years * len(catalogo) * lineas
+        year_col = np.repeat(np.arange(year_inicial, year_inicial + years), len(catalogo) * lineas)
+        idx_cuenta = np.tile(np.repeat(np.arange(len(catalogo)), lineas), years)
+        fila_year = year_col - year_inicial
+        valores = saldos[fila_year, idx_cuenta] / lineas * np_rng.uniform(0.5, 1.5, n_filas)
+        libros[f"empresa-{e + 1}"] = pd.DataFrame({
+            'id': [f"{e}-{i}" for i in range(n_filas)],
+            'accountName': nombres[idx_cuenta],
+            'value': np.round(valores, 2),
+            'year': year_col,
+            'type': tipos[idx_cuenta],
+        })
+    return libros
+
+def cronometrar(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, time.perf_counter() - t0
+
+def medir_empresa(raw_df):
+    """Tiempo (s) de cada etapa del pipeline para un libro"""
+    tiempos = {}
+    raw_df = raw_df.copy()
+
+    clasificador.limpiar_cache()
+    df, tiempos['clasificacion'] = cronometrar(main.clasificar_df, raw_df)
+    _, tiempos['clasificacion_cache'] = cronometrar(main.clasificar_df, raw_df)
+
+    def estados():
+        saldos = main.agregar_saldos(df)
+        return saldos, main.generar_estados_financieros(df, saldos=saldos)
+    (saldos, statements), tiempos['estados_financieros'] = cronometrar(estados)
+    years = sorted(statements)
+
+    capital, tiempos['capital_trabajo'] = cronometrar(main.tabla_capital_trabajo, saldos)
+
+    def ratios():
+        return [main.calcular_ratios_completos(statements, y, capital[y]) for y in years]
+    ratios_res, tiempos['ratios'] = cronometrar(ratios)
+
+    def flujos():
+        return [main.generar_flujo_efectivo(statements[y], capital[y], y)
+                for i, y in enumerate(years) if i]
+    flujos_res, tiempos['flujo_efectivo'] = cronometrar(flujos)
+
+    vertical, tiempos['vertical'] = cronometrar(generar_analisis_vertical, df, statements)
+    horizontal, tiempos['horizontal'] = cronometrar(generar_analisis_horizontal, df)
+    proforma, tiempos['proforma'] = cronometrar(main.generar_proforma, statements, years[0])
+    conclusion, tiempos['conclusion'] = cronometrar(
+        main.generar_conclusion_experta, ratios_res, proforma, flujos_res, statements)
+
+    resultado = {
+        "ratios": ratios_res, "vertical": vertical, "horizontal": horizontal,
+        "flujo_efectivo": flujos_res, "financial_statements": statements, "proforma": proforma,
+        "conclusion": conclusion,
+    }
+    payload, tiempos['serializacion_json'] = cronometrar(main.serializar, resultado)
+    tiempos['total'] = sum(tiempos.values()) - tiempos['clasificacion_cache']
+    return tiempos, len(payload)
+
+def resumir(muestras):
+    return {
+        "min": min(muestras),
+        "mediana": statistics.median(muestras),
+        "media": statistics.fmean(muestras),
+        "max": max(muestras),
+    }
+
+def version_git():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def ejecutar(args):
+    libros = generar_libro(args.empresas, args.years, args.cuentas, args.lineas, args.seed)
+    muestras = {}
+    bytes_json = []
+    for _ in range(args.repeticiones):
+        for raw_df in libros.values():
+            tiempos, n_bytes = medir_empresa(raw_df)
+            bytes_json.append(n_bytes)
+            for etapa, t in tiempos.items():
+                muestras.setdefault(etapa, []).append(t)
+
+    return {
+        "fecha": datetime.now().isoformat(timespec='seconds'),
+        "commit": version_git(),
+        "entorno": {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__},
+        "parametros": vars(args),
+        "filas_por_empresa": int(statistics.mean(len(df) for df in libros.values())),
+        "bytes_json_por_empresa": int(statistics.mean(bytes_json)),
+        "etapas": {etapa: resumir(ts) for etapa, ts in muestras.items()},
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline de análisis financiero")
+    parser.add_argument('--empresas', type=int, default=3)
+    parser.add_argument('--years', type=int, default=10)
+    parser.add_argument('--cuentas', type=int, default=80, help="cuentas por empresa")
+    parser.add_argument('--lineas', type=int, default=10, help="asientos por cuenta y año")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark.json')
+    args = parser.parse_args()
+
+    resultado = ejecutar(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    print(f"{resultado['filas_por_empresa']} filas por empresa, {args.empresas} empresas x {args.repeticiones} repeticiones")
+    for etapa, s in resultado['etapas'].items():
+        print(f"  {etapa:<22} mediana {s['mediana'] * 1000:9.2f} ms   min {s['min'] * 1000:9.2f} ms")
+    print(f"Resultados en {args.output}")
+
+if __name__ == '__main__':
+    main_cli()
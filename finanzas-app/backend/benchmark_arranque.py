@@ -0,0 +1,145 @@
+"""Benchmark de arranque en frío del backend.
+
+Uso:
+    python benchmark_arranque.py --repeticiones 5 --output benchmark_arranque.json
+
+Mide, siempre en procesos nuevos:
+  * importacion: tiempo de `import main` (y si pandas/numpy quedaron cargados).
+  * servidor: se levanta uvicorn y se cronometra hasta que acepta conexiones, hasta que
+    /ready responde 200 y la latencia del primer /analyze. Modo "frio" (FINANZAS_CALENTAR=0,
+    /analyze en cuanto escucha) contra modo "calentado" (espera /ready antes de /analyze).
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+from benchmark import generar_libro, resumir, version_git
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+CODIGO_IMPORTACION = (
+    "import sys, time, json; t = time.perf_counter(); import main; "
+    "print(json.dumps({'segundos': time.perf_counter() - t, "
+    "'pandas': 'pandas' in sys.modules, 'numpy': 'numpy' in sys.modules}))"
+)
+MODOS = {
+    "frio": {"FINANZAS_CALENTAR": "0"},
+    "calentado": {"FINANZAS_CALENTAR": "1"},
+}
+
+def medir_importacion():
+    salida = subprocess.run([sys.executable, "-c", CODIGO_IMPORTACION], cwd=DIRECTORIO,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+def puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def pedir(url, cuerpo=None, timeout=60):
+    """(status, segundos) de una petición GET o POST JSON; status None si no hay conexión"""
+    datos = None if cuerpo is None else json.dumps(cuerpo).encode()
+    req = urllib.request.Request(url, data=datos, headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            r.read()
+            status = r.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        return None, time.perf_counter() - t0
+    return status, time.perf_counter() - t0
+
+def esperar(url, aceptar, limite=60):
+    fin = time.perf_counter() + limite
+    while time.perf_counter() < fin:
+        status, _ = pedir(url, timeout=2)
+        if aceptar(status): return status
+        time.sleep(0.01)
+    raise TimeoutError(f"Sin respuesta válida de {url}")
+
+def medir_servidor(modo, cuerpo):
+    puerto = puerto_libre()
+    base = f"http://127.0.0.1:{puerto}"
+    env = {**os.environ, **MODOS[modo], "FINANZAS_CACHE": "memoria"}
+    t0 = time.perf_counter()
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(puerto), "--log-level", "warning"],
+        cwd=DIRECTORIO, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        esperar(f"{base}/ready", lambda s: s is not None)
+        escucha = time.perf_counter() - t0
+        if modo == "calentado":
+            esperar(f"{base}/ready", lambda s: s == 200)
+        listo = time.perf_counter() - t0
+        status, latencia = pedir(f"{base}/analyze", cuerpo)
+        if status != 200:
+            raise RuntimeError(f"/analyze respondió {status}")
+        return {"escucha": escucha, "listo": listo, "primer_analyze": latencia,
+                "hasta_primer_analyze": time.perf_counter() - t0}
+    finally:
+        proceso.terminate()
+        proceso.wait()
+
+def ejecutar(args):
+    raw_df = next(iter(generar_libro(1, args.years, args.cuentas, args.lineas, args.seed).values()))
+    cuerpo = {"records": raw_df.to_dict(orient='records')}
+
+    importaciones = [medir_importacion() for _ in range(args.repeticiones)]
+    servidor = {}
+    for modo in MODOS:
+        muestras = {}
+        for _ in range(args.repeticiones):
+            for medida, t in medir_servidor(modo, cuerpo).items():
+                muestras.setdefault(medida, []).append(t)
+        servidor[modo] = {medida: resumir(ts) for medida, ts in muestras.items()}
+
+    return {
+        "fecha": datetime.now().isoformat(timespec='seconds'),
+        "commit": version_git(),
+        "entorno": {"python": platform.python_version()},
+        "parametros": vars(args),
+        "filas_analyze": len(raw_df),
+        "importacion": {
+            "segundos": resumir([m['segundos'] for m in importaciones]),
+            "pandas_cargado": any(m['pandas'] for m in importaciones),
+            "numpy_cargado": any(m['numpy'] for m in importaciones),
+        },
+        "servidor": servidor,
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío del backend")
+    parser.add_argument('--repeticiones', type=int, default=3)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--cuentas', type=int, default=60)
+    parser.add_argument('--lineas', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='benchmark_arranque.json')
+    args = parser.parse_args()
+
+    resultado = ejecutar(args)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+    imp = resultado['importacion']
+    print(f"import main: mediana {imp['segundos']['mediana'] * 1000:.1f} ms "
+          f"(pandas cargado: {imp['pandas_cargado']}, numpy cargado: {imp['numpy_cargado']})")
+    for modo, medidas in resultado['servidor'].items():
+        print(f"  {modo}:")
+        for medida, s in medidas.items():
+            print(f"    {medida:<22} mediana {s['mediana'] * 1000:9.2f} ms   min {s['min'] * 1000:9.2f} ms")
+    print(f"Resultados en {args.output}")
+
+if __name__ == '__main__':
+    main_cli()
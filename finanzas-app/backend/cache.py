@@ -0,0 +1,162 @@
+"""Cache de resultados direccionado por contenido.
+
+Las claves son huellas (sha256) de los registros normalizados, así que reenviar los
+mismos datos reutiliza el análisis completo, y editar un año solo invalida las
+entradas que dependen de ese año. El backend es intercambiable: memoria (LRU) o disco.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from arranque import diferido
+
+pd = diferido("pandas")
+
+CACHE_TTL = float(os.environ.get("FINANZAS_CACHE_TTL", "3600"))
+CACHE_MAX = int(os.environ.get("FINANZAS_CACHE_MAX", "2048"))
+# Subir cuando cambia la forma de los resultados: la cache en disco sobrevive a los reinicios
+VERSION_RESULTADOS = 2
+
+def huella(*partes):
+    h = hashlib.sha256()
+    for p in partes:
+        h.update(p if isinstance(p, bytes) else repr(p).encode())
+        h.update(b'\x00')
+    return h.hexdigest()
+
+def _hash_filas(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def huella_filas(df):
+    """Huella de todo el DataFrame (sensible al orden de las filas y a los nombres de columna)"""
+    return huella(list(df.columns), _hash_filas(df).tobytes())
+
+def huellas_por_anio(df):
+    """{year: huella} calculada con un solo hash vectorizado de las filas"""
+    hashes = _hash_filas(df)
+    columnas = list(df.columns)
+    return {
+        int(year): huella(columnas, hashes[posiciones].tobytes())
+        for year, posiciones in df.groupby('year').indices.items()
+    }
+
+class CacheMemoria:
+    """LRU en memoria con expiración. Los valores se comparten: no deben mutarse."""
+
+    def __init__(self, max_items=CACHE_MAX, ttl=CACHE_TTL):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.datos = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Los análisis corren en varios hilos (carriles de admisión, threadpool de FastAPI)
+        self._lock = threading.Lock()
+
+    def get(self, clave):
+        with self._lock:
+            entrada = self.datos.get(clave)
+            if entrada is None or (self.ttl and time.time() - entrada[0] > self.ttl):
+                if entrada is not None: del self.datos[clave]
+                self.misses += 1
+                return None
+            self.datos.move_to_end(clave)
+            self.hits += 1
+            return entrada[1]
+
+    def set(self, clave, valor):
+        with self._lock:
+            self.datos[clave] = (time.time(), valor)
+            self.datos.move_to_end(clave)
+            while len(self.datos) > self.max_items:
+                self.datos.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.datos.clear()
+
+    def __len__(self):
+        return len(self.datos)
+
+    def stats(self):
+        return {"backend": "memoria", "items": len(self), "max_items": self.max_items,
+                "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+class CacheDisco:
+    """Un archivo pickle por clave; sirve para compartir la cache entre procesos y reinicios."""
+
+    def __init__(self, directorio=None, max_items=CACHE_MAX, ttl=CACHE_TTL):
+        self.directorio = directorio or os.path.join(tempfile.gettempdir(), "finanzas-cache")
+        os.makedirs(self.directorio, exist_ok=True)
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, huella(VERSION_RESULTADOS, clave) + ".pkl")
+
+    def get(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            if self.ttl and time.time() - os.path.getmtime(ruta) > self.ttl:
+                os.remove(ruta)
+                raise FileNotFoundError(ruta)
+            with open(ruta, 'rb') as f:
+                valor = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            self.misses += 1
+            return None
+        os.utime(ruta) # renovar para el desalojo LRU
+        self.hits += 1
+        return valor
+
+    def set(self, clave, valor):
+        ruta = self._ruta(clave)
+        tmp = f"{ruta}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, ruta) # escritura atómica, segura con varios procesos
+        self._desalojar()
+
+    def _archivos(self):
+        return [e for e in os.scandir(self.directorio) if e.name.endswith('.pkl')]
+
+    def _desalojar(self):
+        archivos = self._archivos()
+        if len(archivos) <= self.max_items: return
+        archivos.sort(key=lambda e: e.stat().st_mtime)
+        for e in archivos[:len(archivos) - self.max_items]:
+            try: os.remove(e.path)
+            except OSError: pass
+
+    def clear(self):
+        for e in self._archivos():
+            try: os.remove(e.path)
+            except OSError: pass
+
+    def __len__(self):
+        return len(self._archivos())
+
+    def stats(self):
+        return {"backend": "disco", "directorio": self.directorio, "items": len(self),
+                "max_items": self.max_items, "ttl": self.ttl, "hits": self.hits, "misses": self.misses}
+
+BACKENDS = {"memoria": CacheMemoria, "disco": CacheDisco}
+_cache = None
+
+def configurar_cache(backend="memoria", **opciones):
+    """Instala el backend global: 'memoria', 'disco' o cualquier objeto con get/set/clear/stats"""
+    global _cache
+    _cache = BACKENDS[backend](**opciones) if isinstance(backend, str) else backend
+    return _cache
+
+def obtener_cache():
+    if _cache is None:
+        backend = os.environ.get("FINANZAS_CACHE", "memoria")
+        opciones = {"directorio": os.environ["FINANZAS_CACHE_DIR"]} if backend == "disco" and "FINANZAS_CACHE_DIR" in os.environ else {}
+        configurar_cache(backend, **opciones)
+    return _cache
@@ -0,0 +1,56 @@
+"""Capital de trabajo: una tabla por año con los saldos por sub-clase.
+
+Se arma a partir de los saldos que agregar_saldos ya calculó para los estados
+({year: {(type, sub_class): total}}), sin volver a agrupar el DataFrame. De ahí salen
+los saldos (caja, CxC, inventarios, CxP), sus variaciones contra el año anterior
+disponible, los saldos promedio, el CNT, el CNO (CxC + inventarios - CxP) y el ciclo de
+conversión del efectivo. Ratios y flujos de efectivo (directo e indirecto) leen sus
+saldos de aquí en lugar de recorrer las listas de cuentas de cada estado.
+"""
+from arranque import diferido
+
+from razones import ciclo_efectivo, promedio_o_actual, total_saldos, SUBS_AC, SUBS_ANC, SUBS_PC, SUBS_PNC
+
+np = diferido("numpy")
+
+CUENTAS = {'cxc': 'receivables', 'inv': 'inventory', 'cxp': 'payables', 'caja': 'cash'}
+VARIACIONES = ['cxc', 'inv', 'cxp', 'af', 'pnc', 'capital_social']
+PROMEDIOS = ['inv', 'cxc', 'cxp', 'af', 'at']
+
+def tabla_capital_trabajo(saldos):
+    """saldos de agregar_saldos -> {year: {columna: float}} con saldos, variaciones,
+    promedios, CNT, CNO y días del ciclo de efectivo. El primer año no tiene
+    variaciones (None) y su promedio es el saldo actual."""
+    filas = {}
+    anterior = None
+    for year in sorted(saldos):
+        s = saldos[year]
+        f = {corto: total_saldos(s, 'liability' if sub == 'payables' else 'asset', [sub]) for corto, sub in CUENTAS.items()}
+        f['ac'] = total_saldos(s, 'asset', SUBS_AC)
+        f['af'] = total_saldos(s, 'asset', SUBS_ANC)
+        f['at'] = f['ac'] + f['af']
+        f['pc'] = total_saldos(s, 'liability', SUBS_PC)
+        f['pnc'] = total_saldos(s, 'liability', SUBS_PNC)
+        f['capital_social'] = total_saldos(s, 'equity')
+        f['ventas'] = total_saldos(s, 'revenue')
+        f['costo_ventas'] = total_saldos(s, 'expense', ['cogs'])
+
+        for col in VARIACIONES:
+            f[f'var_{col}'] = None if anterior is None else f[col] - anterior[col]
+        f['caja_inicial'] = None if anterior is None else anterior['caja']
+        for col in PROMEDIOS:
+            f[f'prom_{col}'] = f[col] if anterior is None else (f[col] + anterior[col]) / 2
+        f['cnt'] = f['ac'] - f['pc']
+        filas[int(year)] = anterior = f
+
+    # El ciclo de efectivo usa las mismas fórmulas vectorizadas que los demás motores
+    years = list(filas)
+    columna = lambda k: np.array([filas[y][k] for y in years], dtype=float)
+    ciclo = ciclo_efectivo(
+        {k: columna(k) for k in ['cxc', 'inv', 'cxp', 'ventas', 'costo_ventas']},
+        *(promedio_o_actual(columna(f'prom_{k}'), columna(k)) for k in ['inv', 'cxc', 'cxp'])
+    )
+    for k, valores in ciclo.items():
+        for y, v in zip(years, valores.tolist()):
+            filas[y][k] = v
+    return filas
@@ -0,0 +1,134 @@
+"""Clasificación de cuentas por palabras clave.
+
+Las reglas se compilan en una sola expresión regular por tipo principal; el orden
+de las reglas se respeta (la primera que coincide gana), igual que la cadena de
+if's original. Los resultados se memorizan en un LRU que vive entre peticiones.
+"""
+import re
+from functools import lru_cache
+
+from arranque import diferido
+
+np = diferido("numpy")
+pd = diferido("pandas")
+
+TAMANO_CACHE = 4096
+
+PALABRAS_TOTAL = ['TOTAL', 'SUMA', 'RESULTADO DEL', 'UTILIDAD BRUTA', 'UTILIDAD NETA', 'UTILIDAD OPERATIVA']
+
+# (sub_class, palabras clave) en orden de prioridad; el último es el valor por defecto
+REGLAS = {
+    'expense': [
+        ('cogs', ['COSTO', 'VENTAS']),
+        ('interest', ['INTERES', 'FINANCIERO']),
+        ('tax', ['IMPUESTO', 'RENTA']),
+        # Detectar depreciación para el flujo de efectivo
+        ('depreciation', ['DEPREC', 'AMORTIZ']),
+        ('operating_expense', None),
+    ],
+    'asset': [
+        ('cash', ['CAJA', 'BANCO', 'EFECTIVO', 'DISPONIBLE']),
+        ('receivables', ['CLIENTE', 'COBRAR', 'DEUDORES']),
+        ('inventory', ['INVENTARIO', 'ALMACEN', 'MERCADERIA', 'EXISTENCIA']),
+        ('current_asset', ['CORRIENTE', 'CIRCULANTE', 'CORTO PLAZO']),
+        ('fixed_asset', ['FIJO', 'MAQUINARIA', 'EDIFICIO', 'EQUIPO', 'TERRENO', 'VEHICULO', 'PROPIEDAD']),
+        ('non_current_asset', None),
+    ],
+    'liability': [
+        ('payables', ['PROVEEDOR', 'PAGAR', 'ACREEDORES']),
+        ('current_liability', ['CORRIENTE', 'CORTO PLAZO']),
+        ('non_current_liability', None),
+    ],
+}
+
+def _compilar(reglas):
+    """Una alternativa con lookahead por regla: re.match prueba las ramas en orden,
+    así que la prioridad de las reglas se conserva aunque la palabra aparezca más a la derecha."""
+    ramas = []
+    for i, (_, palabras) in enumerate(reglas):
+        if palabras:
+            patron = '|'.join(re.escape(p) for p in palabras)
+            ramas.append(f"(?=.*(?:{patron}))(?P<r{i}>)")
+        else:
+            ramas.append(f"(?P<r{i}>)")
+    return re.compile('|'.join(ramas), re.DOTALL)
+
+PATRONES = {tipo: _compilar(reglas) for tipo, reglas in REGLAS.items()}
+PATRON_TOTAL = re.compile('|'.join(re.escape(p) for p in PALABRAS_TOTAL))
+
+# Tablas de excepciones por empresa: {company_id: {(NOMBRE, type): sub_class}}
+OVERRIDES = {}
+
+def _normalizar(nombre):
+    return str(nombre).strip().upper()
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _clasificar_normalizado(n, tipo_principal):
+    patron = PATRONES.get(tipo_principal)
+    if patron is None:
+        return tipo_principal
+    m = patron.match(n)
+    return REGLAS[tipo_principal][int(m.lastgroup[1:])][0]
+
+@lru_cache(maxsize=TAMANO_CACHE)
+def _es_total_normalizado(n):
+    return PATRON_TOTAL.match(n) is not None
+
+def clasificar_cuenta(nombre, tipo_principal, company_id=None):
+    n = _normalizar(nombre)
+    if company_id is not None:
+        sub = OVERRIDES.get(company_id, {}).get((n, tipo_principal))
+        if sub is not None:
+            return sub
+    return _clasificar_normalizado(n, tipo_principal)
+
+def es_cuenta_total(nombre):
+    return _es_total_normalizado(_normalizar(nombre))
+
+def clasificar_serie(nombres, tipos, company_id=None):
+    """Clasifica columnas completas evaluando solo los pares (nombre, tipo) únicos"""
+    pares = pd.MultiIndex.from_arrays([nombres, tipos])
+    codigos, unicos = pares.factorize()
+    resultado = np.array([clasificar_cuenta(n, t, company_id) for n, t in unicos], dtype=object)
+    return pd.Series(resultado[codigos], index=nombres.index)
+
+def marcar_totales(nombres):
+    """Serie booleana: True en las filas que son cuentas de total/subtotal"""
+    codigos, unicos = pd.factorize(nombres)
+    resultado = np.array([es_cuenta_total(n) for n in unicos], dtype=bool)
+    return pd.Series(resultado[codigos], index=nombres.index)
+
+def registrar_overrides(company_id, tabla):
+    """tabla: lista de {accountName, type, sub_class}. Reemplaza la tabla previa de la empresa."""
+    OVERRIDES[company_id] = {
+        (_normalizar(fila['accountName']), fila['type']): fila['sub_class'] for fila in tabla
+    }
+    return len(OVERRIDES[company_id])
+
+def eliminar_overrides(company_id):
+    return OVERRIDES.pop(company_id, None) is not None
+
+def estadisticas_cache():
+    info = _clasificar_normalizado.cache_info()
+    info_total = _es_total_normalizado.cache_info()
+    consultas = info.hits + info.misses
+    return {
+        "clasificacion": {
+            "hits": info.hits,
+            "misses": info.misses,
+            "size": info.currsize,
+            "maxsize": info.maxsize,
+            "hit_rate": info.hits / consultas if consultas else 0.0,
+        },
+        "totales": {
+            "hits": info_total.hits,
+            "misses": info_total.misses,
+            "size": info_total.currsize,
+            "maxsize": info_total.maxsize,
+        },
+        "empresas_con_overrides": len(OVERRIDES),
+    }
+
+def limpiar_cache():
+    _clasificar_normalizado.cache_clear()
+    _es_total_normalizado.cache_clear()
@@ -0,0 +1,97 @@
+"""Esquema columnar para peticiones grandes.
+
+En lugar de una lista de objetos (un modelo Pydantic por línea del libro), el cuerpo
+trae arreglos paralelos: {"columns": {"accountName": [...], "value": [...], "year": [...],
+"type": [...], "id": [...]}}. Las columnas se validan completas con pandas/numpy y pasan
+directo al DataFrame, sin crear objetos de Python por fila. Las reglas son las de
+FinancialRecord: textos para nombre/tipo/id, números (o texto numérico) para value y
+enteros para year.
+"""
+import json
+
+from arranque import diferido
+
+np = diferido("numpy")
+pd = diferido("pandas")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+OBLIGATORIAS = ['accountName', 'value', 'year', 'type']
+# Mismo orden que FinancialRecord.dict(), así la huella de la cache coincide con /analyze
+ORDEN = ['id', 'accountName', 'value', 'year', 'type']
+MAX_ERRORES = 20
+
+class ErrorColumnas(ValueError):
+    def __init__(self, errores):
+        self.errores = errores
+        super().__init__("; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in errores))
+
+def leer_json(cuerpo):
+    if orjson is not None:
+        return orjson.loads(cuerpo)
+    return json.loads(cuerpo)
+
+def _errores(columna, invalidas, msg):
+    return [{"loc": ["columns", columna, int(i)], "msg": msg} for i in invalidas[:MAX_ERRORES]]
+
+# infer_dtype recorre la columna en C; solo si falla se buscan las posiciones inválidas
+def _textos(columna, valores):
+    serie = pd.Series(valores, dtype=object)
+    if pd.api.types.infer_dtype(serie, skipna=False) == 'string':
+        return serie, []
+    invalidas = np.flatnonzero(~serie.map(type).eq(str).to_numpy())
+    return serie, _errores(columna, invalidas, "debe ser texto")
+
+def _numeros(columna, valores, enteros=False):
+    serie = pd.Series(valores, dtype=object)
+    tipo = pd.api.types.infer_dtype(serie, skipna=False)
+    if tipo == 'integer' or (tipo in ('floating', 'mixed-integer-float') and not enteros):
+        numeros = serie.to_numpy(dtype=float)
+        if not np.isnan(numeros).any():
+            return numeros, []
+    numeros = pd.to_numeric(serie, errors='coerce').astype(float).to_numpy()
+    invalidas = np.isnan(numeros)
+    msg = "debe ser un número"
+    if enteros:
+        invalidas |= ~np.isnan(numeros) & (numeros != np.round(numeros))
+        msg = "debe ser un entero"
+    return numeros, _errores(columna, np.flatnonzero(invalidas), msg)
+
+def dataframe_columnar(columnas):
+    """{columna: [valores]} -> DataFrame con las columnas de FinancialRecord.
+    Lanza ErrorColumnas con las posiciones inválidas (hasta MAX_ERRORES por columna)."""
+    if not isinstance(columnas, dict):
+        raise ErrorColumnas([{"loc": ["columns"], "msg": "debe ser un objeto {columna: [valores]}"}])
+    faltantes = [c for c in OBLIGATORIAS if c not in columnas]
+    if faltantes:
+        raise ErrorColumnas([{"loc": ["columns", c], "msg": "columna obligatoria"} for c in faltantes])
+    no_listas = [c for c in ORDEN if c in columnas and not isinstance(columnas[c], list)]
+    if no_listas:
+        raise ErrorColumnas([{"loc": ["columns", c], "msg": "debe ser una lista"} for c in no_listas])
+    largos = {c: len(columnas[c]) for c in ORDEN if c in columnas}
+    n = largos['accountName']
+    if any(largo != n for largo in largos.values()):
+        raise ErrorColumnas([{"loc": ["columns"], "msg": f"las columnas tienen largos distintos: {largos}"}])
+
+    errores = []
+    nombres, e = _textos('accountName', columnas['accountName']); errores += e
+    tipos, e = _textos('type', columnas['type']); errores += e
+    valores, e = _numeros('value', columnas['value']); errores += e
+    years, e = _numeros('year', columnas['year'], enteros=True); errores += e
+    if 'id' in columnas:
+        ids, e = _textos('id', columnas['id']); errores += e
+    else:
+        ids = pd.Series([f"col-{i}" for i in range(1, n + 1)], dtype=object)
+    if errores:
+        raise ErrorColumnas(errores)
+
+    return pd.DataFrame({
+        'id': ids.astype(str),
+        'accountName': nombres.astype(str),
+        'value': valores,
+        'year': years.astype(np.int64),
+        'type': tipos.astype(str),
+    })[ORDEN]
@@ -0,0 +1,189 @@
+"""Escenarios Monte Carlo para la proyección (proforma) de varios años.
+
+Los impulsores (crecimiento de ventas, márgenes de costo y gasto, días de cobro,
+inventario y pago, intensidad de activo fijo y tasa de impuestos) se ajustan con toda
+la historia anual. Cada trayectoria sortea los impulsores de cada año proyectado; la
+simulación es un arreglo (trayectorias x años) por concepto, así que el único bucle de
+Python es sobre los años de proyección. Devuelve bandas de percentiles del estado de
+resultados, el balance y el flujo de efectivo proyectados.
+"""
+from arranque import diferido
+
+from periodos import estados_por_periodo, agregar_resultados
+from razones import DIAS_ANIO
+
+np = diferido("numpy")
+
+PERCENTILES = [5, 25, 50, 75, 95]
+MAX_YEARS = 10
+MAX_PATHS = 200_000
+# Volatilidad mínima cuando la historia es muy corta para estimarla
+VOL_MIN_CRECIMIENTO = 0.05
+VOL_MIN_RELATIVA = 0.05
+
+def historia_anual(df):
+    """df clasificado -> (years, totales por año) con los mismos conceptos que periodos"""
+    m = (df.groupby(['year', 'type', 'sub_class'])['value'].sum()
+           .unstack(['type', 'sub_class'], fill_value=0.0).sort_index())
+    return [int(y) for y in m.index], agregar_resultados(estados_por_periodo(m))
+
+def _razon(a, b):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = a / b
+    return r[np.isfinite(r) & (b != 0)]
+
+def _ajuste(obs, vol_min):
+    """(media, desviación) de las observaciones con piso de volatilidad"""
+    if len(obs) == 0: return 0.0, 0.0
+    media = float(np.mean(obs))
+    sd = float(np.std(obs, ddof=1)) if len(obs) > 1 else 0.0
+    return media, max(sd, vol_min)
+
+def ajustar_impulsores(h):
+    """Media y desviación de cada impulsor observada en los años históricos"""
+    ventas = h['net_sales']
+    crecimiento = np.log(_razon(ventas[1:], ventas[:-1]))
+    uai = ventas - h['cogs'] - h['operating_expenses'] - h['depreciation'] - h['interest_expense']
+    impulsores = {"crecimiento": _ajuste(crecimiento[np.isfinite(crecimiento)], VOL_MIN_CRECIMIENTO)}
+    relativos = {
+        "margen_costo": _razon(h['cogs'], ventas),
+        "margen_gasto": _razon(h['operating_expenses'], ventas),
+        "margen_depreciacion": _razon(h['depreciation'], ventas),
+        "dias_cobro": _razon(h['receivables'] * DIAS_ANIO, ventas),
+        "dias_inventario": _razon(h['inventory'] * DIAS_ANIO, h['cogs']),
+        "dias_pago": _razon(h['payables'] * DIAS_ANIO, h['cogs']),
+        "intensidad_activo_fijo": _razon(h['non_current_assets'], ventas),
+        "tasa_impuestos": _razon(h['taxes'][uai > 0], uai[uai > 0]),
+    }
+    for nombre, obs in relativos.items():
+        piso = abs(float(np.mean(obs))) * VOL_MIN_RELATIVA if len(obs) else 0.0
+        impulsores[nombre] = _ajuste(obs, piso)
+    return impulsores
+
+def _sortear(rng, impulsores, trayectorias, years):
+    """Un arreglo (trayectorias x años) por impulsor; los porcentajes no bajan de cero"""
+    sorteos = {}
+    for nombre, (media, sd) in impulsores.items():
+        valores = rng.normal(media, sd, size=(trayectorias, years))
+        sorteos[nombre] = valores if nombre == "crecimiento" else np.maximum(valores, 0.0)
+    sorteos["tasa_impuestos"] = np.minimum(sorteos["tasa_impuestos"], 1.0)
+    return sorteos
+
+def proyectar(h, sorteos, years):
+    """Proyecta todas las trayectorias a la vez a partir del último año histórico"""
+    ultimo = {k: float(v[-1]) for k, v in h.items()}
+    trayectorias = sorteos["crecimiento"].shape[0]
+    deuda_lp = ultimo['non_current_liabilities']
+    # La deuda no cambia en la proyección (sin nueva deuda ni amortizaciones), así que los
+    # intereses se mantienen en los del último año, sea la deuda de corto o de largo plazo
+    intereses = np.full(trayectorias, ultimo['interest_expense'])
+    otros_ac = ultimo['current_assets'] - ultimo['cash'] - ultimo['receivables'] - ultimo['inventory']
+    otros_pc = ultimo['current_liabilities'] - ultimo['payables']
+
+    previo = {
+        "ventas": np.full(trayectorias, ultimo['net_sales']),
+        "cxc": np.full(trayectorias, ultimo['receivables']),
+        "inv": np.full(trayectorias, ultimo['inventory']),
+        "cxp": np.full(trayectorias, ultimo['payables']),
+        "anc": np.full(trayectorias, ultimo['non_current_assets']),
+        "caja": np.full(trayectorias, ultimo['cash']),
+        "patrimonio": np.full(trayectorias, ultimo['equity_social'] + ultimo['net_income']),
+    }
+    nombres = [
+        "net_sales", "cogs", "operating_expenses", "depreciation", "operating_income",
+        "interest_expense", "taxes", "net_income", "cash", "receivables", "inventory",
+        "current_assets", "non_current_assets", "total_assets", "payables", "current_liabilities",
+        "total_liabilities", "equity", "total_operacion", "total_inversion", "flujo_neto_periodo",
+    ]
+    salida = {n: np.empty((trayectorias, years)) for n in nombres}
+
+    for a in range(years):
+        ventas = previo["ventas"] * np.exp(sorteos["crecimiento"][:, a])
+        cogs = ventas * sorteos["margen_costo"][:, a]
+        gastos = ventas * sorteos["margen_gasto"][:, a]
+        depreciacion = ventas * sorteos["margen_depreciacion"][:, a]
+        utilidad_op = ventas - cogs - gastos - depreciacion
+        uai = utilidad_op - intereses
+        impuestos = np.maximum(uai, 0.0) * sorteos["tasa_impuestos"][:, a]
+        utilidad_neta = uai - impuestos
+
+        cxc = ventas * sorteos["dias_cobro"][:, a] / DIAS_ANIO
+        inv = cogs * sorteos["dias_inventario"][:, a] / DIAS_ANIO
+        cxp = cogs * sorteos["dias_pago"][:, a] / DIAS_ANIO
+        anc = ventas * sorteos["intensidad_activo_fijo"][:, a]
+
+        # Mismo flujo indirecto que generar_flujo_efectivo; sin nueva deuda ni aportes
+        operacion = utilidad_neta + depreciacion - (cxc - previo["cxc"]) - (inv - previo["inv"]) + (cxp - previo["cxp"])
+        inversion = -(anc - previo["anc"])
+        neto = operacion + inversion
+        caja = previo["caja"] + neto
+        patrimonio = previo["patrimonio"] + utilidad_neta
+
+        ac = caja + cxc + inv + otros_ac
+        pc = cxp + otros_pc
+        valores = {
+            "net_sales": ventas, "cogs": cogs, "operating_expenses": gastos, "depreciation": depreciacion,
+            "operating_income": utilidad_op, "interest_expense": intereses, "taxes": impuestos,
+            "net_income": utilidad_neta, "cash": caja, "receivables": cxc, "inventory": inv,
+            "current_assets": ac, "non_current_assets": anc, "total_assets": ac + anc,
+            "payables": cxp, "current_liabilities": pc, "total_liabilities": pc + deuda_lp,
+            "equity": patrimonio, "total_operacion": operacion, "total_inversion": inversion,
+            "flujo_neto_periodo": neto,
+        }
+        for n in nombres:
+            salida[n][:, a] = valores[n]
+        previo = {"ventas": ventas, "cxc": cxc, "inv": inv, "cxp": cxp, "anc": anc,
+                  "caja": caja, "patrimonio": patrimonio}
+    return salida
+
+SECCIONES = {
+    "income_statement": ["net_sales", "cogs", "operating_expenses", "depreciation", "operating_income",
+                         "interest_expense", "taxes", "net_income"],
+    "balance_sheet": ["cash", "receivables", "inventory", "current_assets", "non_current_assets",
+                      "total_assets", "payables", "current_liabilities", "total_liabilities", "equity"],
+    "flujo_efectivo": ["total_operacion", "total_inversion", "flujo_neto_periodo"],
+}
+
+def bandas(salida, percentiles):
+    """{seccion: {concepto: {"p5": [por año], ..., "mean": [...]}}} con un solo np.percentile"""
+    nombres = list(salida)
+    cubo = np.stack([salida[n] for n in nombres]) # conceptos x trayectorias x años
+    cortes = np.percentile(cubo, percentiles, axis=1) # percentiles x conceptos x años
+    medias = cubo.mean(axis=1)
+    posicion = {n: i for i, n in enumerate(nombres)}
+    resultado = {}
+    for seccion, conceptos in SECCIONES.items():
+        resultado[seccion] = {}
+        for n in conceptos:
+            i = posicion[n]
+            banda = {f"p{p:g}": cortes[j, i].tolist() for j, p in enumerate(percentiles)}
+            banda["mean"] = medias[i].tolist()
+            resultado[seccion][n] = banda
+    return resultado
+
+def simular_escenarios(df, years=3, paths=10_000, seed=None, percentiles=PERCENTILES):
+    """df clasificado de una empresa -> impulsores ajustados y bandas por año proyectado"""
+    if not 1 <= years <= MAX_YEARS:
+        raise ValueError(f"years debe estar entre 1 y {MAX_YEARS}")
+    if not 1 <= paths <= MAX_PATHS:
+        raise ValueError(f"paths debe estar entre 1 y {MAX_PATHS}")
+    if any(not 0 <= p <= 100 for p in percentiles):
+        raise ValueError("Los percentiles deben estar entre 0 y 100")
+    historicos, h = historia_anual(df)
+    if len(historicos) < 2:
+        raise ValueError("Se necesitan al menos dos años de historia para ajustar los impulsores")
+    if h['net_sales'][-1] <= 0:
+        raise ValueError("El último año no tiene ventas para proyectar")
+
+    impulsores = ajustar_impulsores(h)
+    rng = np.random.default_rng(seed)
+    salida = proyectar(h, _sortear(rng, impulsores, paths, years), years)
+    return {
+        "year_base": historicos[-1],
+        "years": [historicos[-1] + i for i in range(1, years + 1)],
+        "paths": paths,
+        "seed": seed,
+        "percentiles": list(percentiles),
+        "drivers": {k: {"mean": m, "std": s} for k, (m, s) in impulsores.items()},
+        **bandas(salida, percentiles),
+    }
@@ -0,0 +1,107 @@
+"""Ingesta de CSV por bloques.
+
+El archivo se lee en trozos con pd.read_csv(chunksize=...); cada trozo se valida,
+se normaliza al formato de FinancialRecord y se agrega por (cuenta, año, tipo), de
+modo que en memoria solo vive el acumulado condensado y nunca el CSV completo.
+"""
+import threading
+import uuid
+from collections import OrderedDict
+
+from arranque import diferido
+
+pd = diferido("pandas")
+
+TAMANO_CHUNK = 50_000
+MAX_INGESTAS = 64
+
+COLUMNAS = ['accountName', 'value', 'year', 'type']
+TIPOS_VALIDOS = {'asset', 'liability', 'equity', 'revenue', 'expense'}
+
+# Encabezados alternativos que aparecen en exportaciones contables
+ALIAS_COLUMNAS = {
+    'accountname': 'accountName', 'account': 'accountName', 'cuenta': 'accountName', 'nombre': 'accountName',
+    'value': 'value', 'valor': 'value', 'monto': 'value', 'saldo': 'value',
+    'year': 'year', 'anio': 'year', 'año': 'year', 'ano': 'year', 'periodo': 'year',
+    'type': 'type', 'tipo': 'type',
+}
+ALIAS_TIPOS = {
+    'activo': 'asset', 'pasivo': 'liability', 'patrimonio': 'equity', 'capital': 'equity',
+    'ingreso': 'revenue', 'ingresos': 'revenue', 'gasto': 'expense', 'gastos': 'expense',
+    'costo': 'expense', 'costos': 'expense',
+}
+
+# Ingestas condensadas disponibles para /analyze (las más antiguas se descartan)
+INGESTAS = OrderedDict()
+# Se guardan desde el event loop y se leen desde los hilos de análisis
+_lock = threading.Lock()
+
+class ErrorIngesta(ValueError):
+    pass
+
+def normalizar_columnas(chunk):
+    renombres = {c: ALIAS_COLUMNAS.get(str(c).strip().lower()) for c in chunk.columns}
+    chunk = chunk.rename(columns={c: n for c, n in renombres.items() if n})
+    faltantes = [c for c in COLUMNAS if c not in chunk.columns]
+    if faltantes:
+        raise ErrorIngesta(f"Columnas faltantes en el CSV: {', '.join(faltantes)}")
+    return chunk[COLUMNAS]
+
+def normalizar_chunk(chunk):
+    """Devuelve (filas válidas, número de filas rechazadas)"""
+    chunk = normalizar_columnas(chunk)
+    tipos = chunk['type'].astype(str).str.strip().str.lower()
+    limpio = pd.DataFrame({
+        'accountName': chunk['accountName'].astype(str).str.strip(),
+        'value': pd.to_numeric(chunk['value'], errors='coerce'),
+        'year': pd.to_numeric(chunk['year'], errors='coerce'),
+        'type': tipos.replace(ALIAS_TIPOS),
+    })
+    validas = (
+        limpio['value'].notna() & limpio['year'].notna()
+        & limpio['type'].isin(TIPOS_VALIDOS)
+        & chunk['accountName'].notna() & (limpio['accountName'] != '')
+    )
+    limpio = limpio[validas]
+    return limpio.astype({'year': int}), int((~validas).sum())
+
+def ingerir_csv(archivo, tamano_chunk=TAMANO_CHUNK):
+    """Lee un CSV (ruta o archivo binario) por bloques y condensa las cuentas duplicadas"""
+    acumulado = None
+    leidas = 0
+    rechazadas = 0
+    for chunk in pd.read_csv(archivo, chunksize=tamano_chunk):
+        leidas += len(chunk)
+        limpio, malas = normalizar_chunk(chunk)
+        rechazadas += malas
+        parcial = limpio.groupby(['accountName', 'year', 'type'], sort=False)['value'].sum()
+        acumulado = parcial if acumulado is None else acumulado.add(parcial, fill_value=0)
+
+    if acumulado is None:
+        condensado = pd.DataFrame(columns=['id'] + COLUMNAS)
+    else:
+        condensado = acumulado.reset_index()[COLUMNAS].sort_values(['year', 'type', 'accountName'], kind='stable')
+        condensado.insert(0, 'id', [f"csv-{i}" for i in range(1, len(condensado) + 1)])
+        condensado = condensado.reset_index(drop=True)
+    return condensado, {"rows_read": leidas, "rows_rejected": rechazadas, "records": len(condensado)}
+
+def guardar_ingesta(condensado):
+    ingestion_id = uuid.uuid4().hex
+    with _lock:
+        INGESTAS[ingestion_id] = condensado
+        while len(INGESTAS) > MAX_INGESTAS:
+            INGESTAS.popitem(last=False)
+    return ingestion_id
+
+def ingesta_guardada(ingestion_id):
+    """La ingesta sin copiar (o None), solo para consultar su tamaño"""
+    with _lock:
+        return INGESTAS.get(ingestion_id)
+
+def obtener_ingesta(ingestion_id):
+    with _lock:
+        if ingestion_id not in INGESTAS:
+            raise KeyError(ingestion_id)
+        INGESTAS.move_to_end(ingestion_id)
+        ingesta = INGESTAS[ingestion_id]
+    return ingesta.copy()
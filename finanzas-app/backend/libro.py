@@ -0,0 +1,158 @@
+"""Libro mayor persistente por empresa (SQLite).
+
+Cada empresa guarda sus registros ya normalizados y clasificados (sin cuentas de total),
+así /ledger/{company_id}/analyze no recibe ni valida el historial en JSON: lee solo las
+columnas que usa el pipeline para el rango de años pedido, sobre un índice
+(company_id, year) y con la base mapeada en memoria. La ingesta es solo de anexado: un
+lote solo puede traer años que la empresa todavía no tiene.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from arranque import diferido
+
+from clasificador import clasificar_serie, marcar_totales
+
+pd = diferido("pandas")
+
+LEDGER_DB = os.environ.get("FINANZAS_LEDGER_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos", "libro.sqlite3"))
+MMAP_BYTES = int(os.environ.get("FINANZAS_LEDGER_MMAP", str(256 * 1024 * 1024)))
+
+# Mismo orden de columnas que clasificar_df, para compartir las huellas de la cache
+COLUMNAS = ['id', 'accountName', 'value', 'year', 'type', 'sub_class']
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS libro (
+    company_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    accountName TEXT NOT NULL,
+    value REAL NOT NULL,
+    year INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    sub_class TEXT NOT NULL,
+    lote TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS libro_empresa_year ON libro (company_id, year);
+CREATE TABLE IF NOT EXISTS lotes (
+    lote TEXT PRIMARY KEY,
+    company_id TEXT NOT NULL,
+    creado REAL NOT NULL,
+    filas INTEGER NOT NULL,
+    year_min INTEGER NOT NULL,
+    year_max INTEGER NOT NULL
+);
+"""
+
+class ErrorLibro(ValueError):
+    pass
+
+class AniosRepetidos(ErrorLibro):
+    pass
+
+_local = threading.local()
+_escritura = threading.Lock()
+
+def conexion():
+    """Una conexión por hilo (los carriles de análisis leen en paralelo; WAL lo permite)"""
+    con = getattr(_local, "con", None)
+    if con is None or getattr(_local, "ruta", None) != LEDGER_DB:
+        os.makedirs(os.path.dirname(LEDGER_DB) or ".", exist_ok=True)
+        con = sqlite3.connect(LEDGER_DB)
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute(f"PRAGMA mmap_size={MMAP_BYTES}")
+        con.executescript(ESQUEMA)
+        _local.con, _local.ruta = con, LEDGER_DB
+    return con
+
+def years_guardados(company_id):
+    filas = conexion().execute("SELECT DISTINCT year FROM libro WHERE company_id = ?", (company_id,))
+    return sorted(y for (y,) in filas)
+
+def anexar(company_id, raw_df):
+    """Clasifica y guarda un lote nuevo. Rechaza años que la empresa ya tiene."""
+    if raw_df.empty:
+        raise ErrorLibro("El lote no trae registros")
+    raw_df = raw_df.assign(accountName=raw_df['accountName'].str.strip())
+    df = raw_df[~marcar_totales(raw_df['accountName'])]
+    if df.empty:
+        raise ErrorLibro("El lote solo trae cuentas de total")
+    df = df.assign(sub_class=clasificar_serie(df['accountName'], df['type'], company_id))[COLUMNAS]
+    nuevos = sorted(int(y) for y in df['year'].unique())
+
+    lote = uuid.uuid4().hex
+    with _escritura:
+        con = conexion()
+        repetidos = sorted(set(nuevos) & set(years_guardados(company_id)))
+        if repetidos:
+            raise AniosRepetidos(f"Años ya guardados para {company_id}: {repetidos}")
+        filas = df.astype({'id': str, 'value': float, 'year': int}).itertuples(index=False, name=None)
+        with con:
+            con.executemany(
+                "INSERT INTO libro (company_id, id, accountName, value, year, type, sub_class, lote) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((company_id, *fila, lote) for fila in filas),
+            )
+            con.execute("INSERT INTO lotes VALUES (?, ?, ?, ?, ?, ?)",
+                        (lote, company_id, time.time(), len(df), nuevos[0], nuevos[-1]))
+    return {"company_id": company_id, "batch_id": lote, "records": len(df),
+            "totals_skipped": len(raw_df) - len(df), "years": nuevos}
+
+def _filtro(company_id, desde=None, hasta=None):
+    sql, params = "company_id = ?", [company_id]
+    if desde is not None:
+        sql += " AND year >= ?"
+        params.append(desde)
+    if hasta is not None:
+        sql += " AND year <= ?"
+        params.append(hasta)
+    return sql, params
+
+def contar(company_id, desde=None, hasta=None):
+    sql, params = _filtro(company_id, desde, hasta)
+    return conexion().execute(f"SELECT COUNT(*) FROM libro WHERE {sql}", params).fetchone()[0]
+
+def leer(company_id, desde=None, hasta=None):
+    """DataFrame clasificado (columnas de clasificar_df) en orden de ingesta"""
+    sql, params = _filtro(company_id, desde, hasta)
+    df = pd.read_sql_query(f"SELECT {', '.join(COLUMNAS)} FROM libro WHERE {sql} ORDER BY rowid",
+                           conexion(), params=params)
+    return df.astype({'value': float, 'year': int})
+
+def resumen(company_id):
+    con = conexion()
+    lotes = con.execute(
+        "SELECT lote, creado, filas, year_min, year_max FROM lotes WHERE company_id = ? ORDER BY creado",
+        (company_id,)).fetchall()
+    return {
+        "company_id": company_id,
+        "records": contar(company_id),
+        "years": years_guardados(company_id),
+        "batches": [{"batch_id": l, "created": c, "records": n, "year_from": a, "year_to": b}
+                    for l, c, n, a, b in lotes],
+    }
+
+def reclasificar(company_id):
+    """Vuelve a clasificar las cuentas guardadas (p.ej. tras cambiar los overrides)"""
+    with _escritura:
+        con = conexion()
+        pares = pd.read_sql_query("SELECT DISTINCT accountName, type FROM libro WHERE company_id = ?",
+                                  con, params=[company_id])
+        if pares.empty: return 0
+        pares['sub_class'] = clasificar_serie(pares['accountName'], pares['type'], company_id)
+        with con:
+            con.executemany(
+                "UPDATE libro SET sub_class = ? WHERE company_id = ? AND accountName = ? AND type = ?",
+                ((s, company_id, n, t) for n, t, s in pares[['accountName', 'type', 'sub_class']].itertuples(index=False)),
+            )
+    return len(pares)
+
+def eliminar(company_id):
+    with _escritura:
+        con = conexion()
+        with con:
+            borradas = con.execute("DELETE FROM libro WHERE company_id = ?", (company_id,)).rowcount
+            con.execute("DELETE FROM lotes WHERE company_id = ?", (company_id,))
+    return borradas
@@ -1,11 +1,55 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any
-import pandas as pd
-import io
+from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse, JSONResponse
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Any, Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import asynccontextmanager
+import asyncio
+import importlib
+import os
+import time
+import logging
 
-app = FastAPI(title="FinAnalyzer Pro 360")
+import arranque
+from arranque import diferido
+import clasificador
+
+from clasificador import (
+    clasificar_serie, marcar_totales, registrar_overrides, eliminar_overrides, estadisticas_cache
+)
+from analisis import generar_analisis_vertical, generar_analisis_horizontal
+from periodos import analizar_periodos
+from panel import analizar_portafolio, PERCENTILES
+import escenarios
+from narrativa import motor, metricas_empresa, metricas_panel, conclusiones
+from capital_trabajo import tabla_capital_trabajo
+from razones import DIAS_ANIO, GRUPOS_ESTADO, total_saldos
+from columnas import dataframe_columnar, leer_json, ErrorColumnas
+import reportes
+import libro
+import admision
+from admision import elegir_carril
+from ingesta import ingerir_csv, guardar_ingesta, obtener_ingesta, ingesta_guardada, ErrorIngesta
+from cache import obtener_cache, huella, huella_filas, huellas_por_anio
+from respuesta import serializar, respuesta_json, validar_opciones, tabla_cuentas, estado_normalizado
+from metricas import (
+    etapa, iniciar_medicion, terminar_medicion, medicion_actual, trazar_memoria,
+    perfilar, exposicion_prometheus, MEDIR_MEMORIA
+)
+
+pd = diferido("pandas")
+
+logger = logging.getLogger("finanzas")
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    """Al arrancar lanza el calentamiento en segundo plano; al cerrar libera pools y carriles"""
+    CALENTAMIENTO.iniciar()
+    yield
+    cerrar_pool()
+
+app = FastAPI(title="FinAnalyzer Pro 360", lifespan=ciclo_de_vida)
 
 origins = ["http://localhost:5173", "http://127.0.0.1:5173"]
 app.add_middleware(
@@ -14,8 +58,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+@app.middleware("http")
+async def medir_peticion(request: Request, call_next):
+    """Medición por petición; la cabecera X-Profile: 1 activa cProfile y memoria pico"""
+    perfil = request.headers.get("x-profile") == "1"
+    medicion, token = iniciar_medicion(memoria=MEDIR_MEMORIA or perfil, perfil=perfil)
+    t0 = time.perf_counter()
+    try:
+        with trazar_memoria(medicion.memoria):
+            response = await call_next(request)
+    finally:
+        terminar_medicion(token)
+    if medicion.etapas:
+        total = (time.perf_counter() - t0) * 1000
+        response.headers["Server-Timing"] = f"{medicion.server_timing()}, total;dur={total:.2f}"
+    return response
+
 class FinancialRecord(BaseModel):
     id: str
     accountName: str
@@ -23,8 +84,78 @@ class FinancialRecord(BaseModel):
     year: int
     type: str 
 
-class AnalysisRequest(BaseModel):
+class OpcionesAnalisis(BaseModel):
+    vertical_format: str = "records" # "records" (lista de dicts) o "columnar"
+    horizontal_mode: str = "first" # "first", "yoy" o "base"
+    horizontal_base_year: Optional[int] = None # requerido con horizontal_mode="base"
+    horizontal_format: str = "records" # "records" o "columnar" (incluye CAGR)
+    response_format: str = "full" # "full" o "slim" (cuentas una sola vez, referenciadas por id)
+    sections: Optional[List[str]] = None # p.ej. ["ratios", "flujo_efectivo"]; None = todas
+
+    def opciones(self):
+        """Parámetros de salida que recibe analizar_df"""
+        validar_opciones(self.response_format, self.sections)
+        return self.dict(include={
+            'vertical_format', 'horizontal_mode', 'horizontal_base_year', 'horizontal_format',
+            'response_format', 'sections'
+        })
+
+class AnalysisRequest(OpcionesAnalisis):
     records: List[FinancialRecord]
+    company_id: Optional[str] = None
+    ingestion_id: Optional[str] = None # CSV ya condensado por /upload-csv?store=true
+
+class ColumnarAnalysisRequest(OpcionesAnalisis):
+    """Todo lo de AnalysisRequest salvo los registros, que llegan en "columns" (ver columnas.py)"""
+    company_id: Optional[str] = None
+    ingestion_id: Optional[str] = None
+
+class LedgerAppendRequest(BaseModel):
+    records: List[FinancialRecord] = []
+    ingestion_id: Optional[str] = None
+
+class LedgerAnalysisRequest(OpcionesAnalisis):
+    year_from: Optional[int] = None # rango de años a leer del libro (None = sin límite)
+    year_to: Optional[int] = None
+
+class PeriodRecord(FinancialRecord):
+    month: int # 1-12; los saldos de balance son al cierre del mes
+
+class PeriodAnalysisRequest(BaseModel):
+    records: List[PeriodRecord]
+    company_id: Optional[str] = None
+    frequency: str = "month" # "month" o "quarter"
+    window_months: int = 12 # ventana móvil para flujos (TTM) y saldos promedio
+
+class BatchAnalysisRequest(BaseModel):
+    # Cada empresa se valida por separado en analyze_batch: un registro inválido solo falla su empresa
+    companies: Dict[str, Dict[str, Any]]
+
+class PortfolioRequest(BaseModel):
+    companies: Dict[str, AnalysisRequest]
+    peer_groups: Optional[Dict[str, str]] = None # company_id -> grupo de pares
+    percentiles: List[float] = PERCENTILES
+
+class ConclusionsRequest(BaseModel):
+    companies: Dict[str, AnalysisRequest]
+
+class ReportRequest(BaseModel):
+    companies: Dict[str, AnalysisRequest]
+    title: Optional[str] = None
+
+class ScenarioRequest(BaseModel):
+    records: List[FinancialRecord] = []
+    company_id: Optional[str] = None
+    ingestion_id: Optional[str] = None
+    years: int = 3 # años a proyectar
+    paths: int = 10_000 # trayectorias Monte Carlo
+    seed: Optional[int] = None # con semilla el resultado es reproducible (y se cachea)
+    percentiles: List[float] = escenarios.PERCENTILES
+
+class ClassificationOverride(BaseModel):
+    accountName: str
+    type: str
+    sub_class: str
 
 # --- UTILIDADES ---
 def safe_div(a, b):
@@ -37,108 +168,97 @@ def to_float(val):
     except:
         return 0.0
 
-def es_cuenta_total(nombre):
-    n = nombre.upper()
-    palabras_clave = ['TOTAL', 'SUMA', 'RESULTADO DEL', 'UTILIDAD BRUTA', 'UTILIDAD NETA', 'UTILIDAD OPERATIVA']
-    if any(n.startswith(k) for k in palabras_clave):
-        return True
-    return False
+# Agrupación de sub-clases por rubro del balance (GRUPOS_ESTADO, en razones) / estado de resultados
+GRUPO_POR_TIPO = {'revenue': 'revenue', 'expense': 'expense', 'equity': 'equity'}
+GRUPO_POR_SUBCLASE = {
+    (tipo, sub): grupo for grupo, (tipo, subs) in GRUPOS_ESTADO.items() for sub in subs
+}
 
-def clasificar_cuenta(nombre, tipo_principal):
-    n = nombre.upper()
-    
-    # GASTOS
-    if tipo_principal == 'expense':
-        if 'COSTO' in n or 'VENTAS' in n: return 'cogs'
-        if 'INTERES' in n or 'FINANCIERO' in n: return 'interest'
-        if 'IMPUESTO' in n or 'RENTA' in n: return 'tax'
-        # Detectar depreciación para el flujo de efectivo
-        if 'DEPREC' in n or 'AMORTIZ' in n: return 'depreciation'
-        return 'operating_expense'
-
-    # ACTIVOS
-    if tipo_principal == 'asset':
-        if any(x in n for x in ['CAJA', 'BANCO', 'EFECTIVO', 'DISPONIBLE']): return 'cash'
-        if any(x in n for x in ['CLIENTE', 'COBRAR', 'DEUDORES']): return 'receivables'
-        if any(x in n for x in ['INVENTARIO', 'ALMACEN', 'MERCADERIA', 'EXISTENCIA']): return 'inventory'
-        if any(x in n for x in ['CORRIENTE', 'CIRCULANTE', 'CORTO PLAZO']): return 'current_asset'
-        if any(x in n for x in ['FIJO', 'MAQUINARIA', 'EDIFICIO', 'EQUIPO', 'TERRENO', 'VEHICULO', 'PROPIEDAD']): return 'fixed_asset'
-        return 'non_current_asset'
-
-    # PASIVOS
-    if tipo_principal == 'liability':
-        if any(x in n for x in ['PROVEEDOR', 'PAGAR', 'ACREEDORES']): return 'payables'
-        if any(x in n for x in ['CORRIENTE', 'CORTO PLAZO']): return 'current_liability'
-        return 'non_current_liability'
-        
-    return tipo_principal
+def agregar_saldos(df):
+    """Una sola pasada agrupada: {year: {(type, sub_class): total}}"""
+    if df.empty: return {}
+    totales = df.groupby(['year', 'type', 'sub_class'], sort=True)['value'].sum()
+    saldos = {}
+    for (year, tipo, sub), valor in totales.items():
+        saldos.setdefault(int(year), {})[(tipo, sub)] = float(valor)
+    return saldos
 
-def generar_estados_financieros(df):
-    years = [int(y) for y in sorted(df['year'].unique())]
+def agrupar_cuentas(df):
+    """Reparte las cuentas en {year: {grupo: [records]}} recorriendo el DataFrame una sola vez"""
+    cuentas = {}
+    for rec in df.to_dict('records'):
+        grupo = GRUPO_POR_TIPO.get(rec['type']) or GRUPO_POR_SUBCLASE.get((rec['type'], rec['sub_class']))
+        if grupo is None: continue
+        cuentas.setdefault(int(rec['year']), {}).setdefault(grupo, []).append(rec)
+    return cuentas
+
+def resumir_cuentas(saldos_year, year):
+    """Sustituye las listas de cuentas por una línea agregada por sub-clase"""
+    cuentas = {}
+    for (tipo, sub), valor in saldos_year.items():
+        grupo = GRUPO_POR_TIPO.get(tipo) or GRUPO_POR_SUBCLASE.get((tipo, sub))
+        if grupo is None: continue
+        cuentas.setdefault(grupo, []).append({
+            "accountName": sub, "value": valor, "year": year, "type": tipo, "sub_class": sub
+        })
+    return cuentas
+
+def generar_estados_financieros(df, incluir_cuentas=True, saldos=None):
+    """Arma balance y estado de resultados de todos los años a partir de la matriz
+    year x type x sub_class. Con incluir_cuentas=False las listas 'accounts' traen
+    una línea por sub-clase en lugar de cada cuenta (suficiente para ratios y flujos).
+    saldos: resultado de agregar_saldos(df) si ya se calculó."""
+    if saldos is None: saldos = agregar_saldos(df)
+    cuentas = agrupar_cuentas(df) if incluir_cuentas else {}
     statements = {}
-    
-    for year in years:
-        df_year = df[df['year'] == year]
-        
+
+    for year in sorted(saldos):
+        s = saldos[year]
+
+        def total(tipo, subclases=None):
+            return total_saldos(s, tipo, subclases)
+
+        grupos = cuentas.get(year, {}) if incluir_cuentas else resumir_cuentas(s, year)
+
         # --- ESTADO DE RESULTADOS ---
-        revenues = df_year[df_year['type'] == 'revenue'].to_dict('records')
-        net_sales = to_float(sum(x['value'] for x in revenues))
-        
-        expenses = df_year[df_year['type'] == 'expense'].to_dict('records')
-        
-        cogs_recs = [x for x in expenses if x['sub_class'] == 'cogs']
-        cogs = to_float(sum(x['value'] for x in cogs_recs))
-        
+        net_sales = total('revenue')
+        cogs = total('expense', ['cogs'])
         # Separar depreciación de otros gastos operativos
-        deprec_recs = [x for x in expenses if x['sub_class'] == 'depreciation']
-        depreciation = to_float(sum(x['value'] for x in deprec_recs))
+        depreciation = total('expense', ['depreciation'])
+        op_exps = total('expense', ['operating_expense'])
+        interest = total('expense', ['interest'])
+        taxes = total('expense', ['tax'])
 
-        op_exps_recs = [x for x in expenses if x['sub_class'] == 'operating_expense']
-        op_exps = to_float(sum(x['value'] for x in op_exps_recs))
-        
-        interest_recs = [x for x in expenses if x['sub_class'] == 'interest']
-        interest = to_float(sum(x['value'] for x in interest_recs))
-        
-        tax_recs = [x for x in expenses if x['sub_class'] == 'tax']
-        taxes = to_float(sum(x['value'] for x in tax_recs))
-        
         gross_profit = net_sales - cogs
         operating_income = gross_profit - op_exps - depreciation
         net_income = operating_income - interest - taxes
-        
+
         # --- BALANCE GENERAL ---
-        assets = df_year[df_year['type'] == 'asset'].to_dict('records')
-        ac_accounts = [x for x in assets if x['sub_class'] in ['cash', 'receivables', 'inventory', 'current_asset']]
-        total_ac = to_float(sum(x['value'] for x in ac_accounts))
-        anc_accounts = [x for x in assets if x['sub_class'] in ['fixed_asset', 'non_current_asset']]
-        total_anc = to_float(sum(x['value'] for x in anc_accounts))
+        total_ac = total(*GRUPOS_ESTADO['ac'])
+        total_anc = total(*GRUPOS_ESTADO['anc'])
         total_assets = total_ac + total_anc
-        
-        liabs = df_year[df_year['type'] == 'liability'].to_dict('records')
-        pc_accounts = [x for x in liabs if x['sub_class'] in ['payables', 'current_liability']]
-        total_pc = to_float(sum(x['value'] for x in pc_accounts))
-        pnc_accounts = [x for x in liabs if x['sub_class'] in ['non_current_liability']]
-        total_pnc = to_float(sum(x['value'] for x in pnc_accounts))
+
+        total_pc = total(*GRUPOS_ESTADO['pc'])
+        total_pnc = total(*GRUPOS_ESTADO['pnc'])
         total_liabs = total_pc + total_pnc
-        
-        equity_recs = df_year[df_year['type'] == 'equity'].to_dict('records')
-        total_equity_social = to_float(sum(x['value'] for x in equity_recs))
+
+        total_equity_social = total('equity')
         total_equity_final = total_equity_social + net_income
-        
+
         statements[int(year)] = {
             "balance_sheet": {
                 "assets": {
-                    "current": {"accounts": ac_accounts, "total": total_ac},
-                    "non_current": {"accounts": anc_accounts, "total": total_anc},
+                    "current": {"accounts": grupos.get('ac', []), "total": total_ac},
+                    "non_current": {"accounts": grupos.get('anc', []), "total": total_anc},
                     "total": total_assets
                 },
                 "liabilities": {
-                    "current": {"accounts": pc_accounts, "total": total_pc},
-                    "non_current": {"accounts": pnc_accounts, "total": total_pnc},
+                    "current": {"accounts": grupos.get('pc', []), "total": total_pc},
+                    "non_current": {"accounts": grupos.get('pnc', []), "total": total_pnc},
                     "total": total_liabs
                 },
                 "equity": {
-                    "accounts": equity_recs,
+                    "accounts": grupos.get('equity', []),
                     "retained_earnings": net_income,
                     "total": total_equity_final
                 },
@@ -154,37 +274,23 @@ def generar_estados_financieros(df):
                 "interest_expense": interest,
                 "taxes": taxes,
                 "net_income": net_income,
-                "revenues_list": revenues, # Para detalles si se necesita
-                "expenses_list": expenses
+                "revenues_list": grupos.get('revenue', []), # Para detalles si se necesita
+                "expenses_list": grupos.get('expense', [])
             }
         }
     return statements
 
-def generar_flujo_efectivo(curr_stmt, prev_stmt, year):
-    """Calcula el flujo de efectivo Método Indirecto y Directo (Estimado)"""
+def generar_flujo_efectivo(curr_stmt, capital, year):
+    """Calcula el flujo de efectivo Método Indirecto y Directo (Estimado).
+    capital: fila del año en la tabla de capital de trabajo (saldos y variaciones)"""
     
     # Datos actuales
     inc = curr_stmt['income_statement']
-    bs_curr = curr_stmt['balance_sheet']
-    bs_prev = prev_stmt['balance_sheet']
 
     # Variaciones (Actual - Anterior)
-    def get_total(group, subclass):
-        return sum(x['value'] for x in group if x['sub_class'] == subclass)
-
-    # Activos Corrientes
-    cxc_curr = get_total(bs_curr['assets']['current']['accounts'], 'receivables')
-    cxc_prev = get_total(bs_prev['assets']['current']['accounts'], 'receivables')
-    var_cxc = cxc_curr - cxc_prev
-
-    inv_curr = get_total(bs_curr['assets']['current']['accounts'], 'inventory')
-    inv_prev = get_total(bs_prev['assets']['current']['accounts'], 'inventory')
-    var_inv = inv_curr - inv_prev
-
-    # Pasivos Corrientes
-    cxp_curr = get_total(bs_curr['liabilities']['current']['accounts'], 'payables')
-    cxp_prev = get_total(bs_prev['liabilities']['current']['accounts'], 'payables')
-    var_cxp = cxp_curr - cxp_prev
+    var_cxc = capital['var_cxc']
+    var_inv = capital['var_inv']
+    var_cxp = capital['var_cxp']
 
     # --- MÉTODO INDIRECTO ---
     # Actividades de Operación
@@ -197,25 +303,19 @@ def generar_flujo_efectivo(curr_stmt, prev_stmt, year):
     flujo_operativo = utilidad_neta + depreciacion - var_cxc - var_inv + var_cxp
 
     # Actividades de Inversión
-    af_curr = bs_curr['assets']['non_current']['total']
-    af_prev = bs_prev['assets']['non_current']['total']
     # Aumento en Activos Fijos es salida de dinero (Compra)
-    flujo_inversion = -(af_curr - af_prev) # Asumiendo no hubo ventas significativas de activos
+    flujo_inversion = -capital['var_af'] # Asumiendo no hubo ventas significativas de activos
 
     # Actividades de Financiamiento
-    pnc_curr = bs_curr['liabilities']['non_current']['total']
-    pnc_prev = bs_prev['liabilities']['non_current']['total']
-    var_deuda_lp = pnc_curr - pnc_prev
+    var_deuda_lp = capital['var_pnc']
     
     # Patrimonio (Sin contar utilidad retenida del año actual para ver aportes/retiros reales)
-    eq_curr_social = sum(x['value'] for x in bs_curr['equity']['accounts'])
-    eq_prev_social = sum(x['value'] for x in bs_prev['equity']['accounts'])
-    var_capital = eq_curr_social - eq_prev_social # Aportes de capital o pago dividendos extras
+    var_capital = capital['var_capital_social'] # Aportes de capital o pago dividendos extras
     
     flujo_financiamiento = var_deuda_lp + var_capital
 
     flujo_neto = flujo_operativo + flujo_inversion + flujo_financiamiento
-    saldo_inicial = get_total(bs_prev['assets']['current']['accounts'], 'cash')
+    saldo_inicial = capital['caja_inicial']
     saldo_final_calc = saldo_inicial + flujo_neto
 
     indirecto = {
@@ -277,7 +377,8 @@ def generar_flujo_efectivo(curr_stmt, prev_stmt, year):
         }
     }
 
-def calcular_ratios_completos(statements, year, prev_stmt=None):
+def calcular_ratios_completos(statements, year, capital):
+    """capital: fila del año en la tabla de capital de trabajo (saldos, promedios y ciclo)"""
     st_curr = statements[year]
     bs = st_curr['balance_sheet']
     income = st_curr['income_statement']
@@ -285,11 +386,8 @@ def calcular_ratios_completos(statements, year, prev_stmt=None):
     ac = bs['assets']['current']['total']
     pc = bs['liabilities']['current']['total']
     
-    def sum_sub(group_list, subclass):
-        return sum(x['value'] for x in group_list if x['sub_class'] == subclass)
-
-    inv_curr = sum_sub(bs['assets']['current']['accounts'], 'inventory')
-    cxc_curr = sum_sub(bs['assets']['current']['accounts'], 'receivables')
+    inv_curr = capital['inv']
+    cxc_curr = capital['cxc']
     af_curr = bs['assets']['non_current']['total']
     at_curr = bs['assets']['total']
     
@@ -303,22 +401,11 @@ def calcular_ratios_completos(statements, year, prev_stmt=None):
     utilidad_neta = income['net_income']
     intereses = income['interest_expense']
     
-    prom_inv = inv_curr
-    prom_cxc = cxc_curr
-    prom_af = af_curr
-    prom_at = at_curr
-    
-    if prev_stmt:
-        bs_prev = prev_stmt['balance_sheet']
-        inv_prev = sum_sub(bs_prev['assets']['current']['accounts'], 'inventory')
-        cxc_prev = sum_sub(bs_prev['assets']['current']['accounts'], 'receivables')
-        af_prev = bs_prev['assets']['non_current']['total']
-        at_prev = bs_prev['assets']['total']
-        
-        prom_inv = (inv_curr + inv_prev) / 2
-        prom_cxc = (cxc_curr + cxc_prev) / 2
-        prom_af = (af_curr + af_prev) / 2
-        prom_at = (at_curr + at_prev) / 2
+    # Promedios con el año anterior (el saldo actual si no hay año anterior)
+    prom_inv = capital['prom_inv']
+    prom_cxc = capital['prom_cxc']
+    prom_af = capital['prom_af']
+    prom_at = capital['prom_at']
 
     if prom_inv == 0: prom_inv = inv_curr if inv_curr > 0 else 1
     if prom_cxc == 0: prom_cxc = cxc_curr if cxc_curr > 0 else 1
@@ -334,15 +421,22 @@ def calcular_ratios_completos(statements, year, prev_stmt=None):
         "liquidez": {
             "cnt": float(ac - pc),
             "razon_circulante": safe_div(ac, pc),
-            "razon_rapida": safe_div(ac - inv_curr, pc)
+            "razon_rapida": safe_div(ac - inv_curr, pc),
+            "cno": capital['cno']
         },
         "actividad": {
             "rotacion_inventarios": safe_div(costo_ventas, prom_inv),
             "rotacion_cxc": safe_div(ventas, prom_cxc),
-            "periodo_cobro": safe_div(360, safe_div(ventas, prom_cxc)),
+            "periodo_cobro": safe_div(DIAS_ANIO, safe_div(ventas, prom_cxc)),
             "rotacion_activos_fijos": safe_div(ventas, prom_af),
             "rotacion_activos_totales": safe_div(ventas, prom_at)
         },
+        "ciclo_efectivo": {
+            "dias_inventario": capital['dias_inventario'],
+            "dias_cobro": capital['dias_cobro'],
+            "dias_pago": capital['dias_pago'],
+            "ciclo_conversion": capital['ciclo_conversion']
+        },
         "endeudamiento": {
             "razon_endeudamiento": safe_div(pasivo_total, at_curr) * 100,
             "razon_pasivo_capital": safe_div(pasivo_total, patrimonio),
@@ -396,108 +490,610 @@ def generar_proforma(statements, year_base):
         }
     }
 
-def generar_conclusion_experta(ratios, proforma):
+def generar_conclusion_experta(ratios, proforma, flujos=(), statements=None):
+    """Diagnóstico del último año con el motor de reglas (narrativa.py) sobre toda la serie"""
     if not ratios: return "Sin datos."
-    ult = ratios[-1]
-    
-    reporte = f"DIAGNÓSTICO {ult['year']}:\n"
-    reporte += f"• Rentabilidad (ROE): {ult['rentabilidad']['roe']:.2f}%. "
-    
-    roe = ult['rentabilidad']['roe']
-    if roe > 20: reporte += "Excelente rendimiento sobre el patrimonio."
-    elif roe > 10: reporte += "Rendimiento aceptable."
-    else: reporte += "Rendimiento bajo, revisar margen y rotación."
-    
-    rc = ult['liquidez']['razon_circulante']
-    reporte += f"\n• Liquidez (Razón Circulante): {rc:.2f}. "
-    if rc > 2: reporte += "Exceso de liquidez o inventario ocioso."
-    elif rc >= 1: reporte += "Liquidez suficiente para cubrir obligaciones CP."
-    else: reporte += "Problemas potenciales de liquidez."
+    tabla = metricas_empresa(ratios, flujos, statements)
+    return conclusiones(tabla, motor().hallazgos(tabla))["empresa"]
+
+def estados_incrementales(df, cache, incluir_cuentas=True):
+    """Estados por año reutilizando los años cuyas filas no cambiaron.
+    Devuelve (statements, huellas, saldos) con la huella de las filas de cada año y los
+    saldos por (type, sub_class) de agregar_saldos, que también se guardan por año.
+    incluir_cuentas se pasa a generar_estados_financieros y forma parte de la clave."""
+    huellas = huellas_por_anio(df)
+    statements = {}
+    saldos = {}
+    faltantes = []
+    for year, h in huellas.items():
+        stmt = cache.get(("estado", h, incluir_cuentas))
+        s = cache.get(("saldos", h))
+        if stmt is None or s is None: faltantes.append(year)
+        else:
+            statements[year] = stmt
+            saldos[year] = s
+
+    if faltantes:
+        df_faltantes = df[df['year'].isin(faltantes)]
+        nuevos_saldos = agregar_saldos(df_faltantes)
+        nuevos = generar_estados_financieros(df_faltantes, incluir_cuentas, nuevos_saldos)
+        for year, stmt in nuevos.items():
+            cache.set(("estado", huellas[year], incluir_cuentas), stmt)
+            cache.set(("saldos", huellas[year]), nuevos_saldos[year])
+        statements.update(nuevos)
+        saldos.update(nuevos_saldos)
+    return {y: statements[y] for y in sorted(statements)}, huellas, saldos
+
+def indices_por_grupo(dfv):
+    """{year: {grupo: [posiciones en dfv]}} con las mismas reglas que agrupar_cuentas"""
+    pares = pd.MultiIndex.from_arrays([dfv['type'], dfv['sub_class']])
+    codigos, unicos = pares.factorize()
+    grupo_unico = [GRUPO_POR_TIPO.get(t) or GRUPO_POR_SUBCLASE.get((t, s)) for t, s in unicos]
+    grupos = pd.Series(grupo_unico, dtype=object).to_numpy()[codigos]
+    indices = {}
+    for (year, grupo), posiciones in pd.DataFrame({'year': dfv['year'].to_numpy(), 'grupo': grupos}) \
+            .dropna().groupby(['year', 'grupo']).indices.items():
+        indices.setdefault(int(year), {})[grupo] = posiciones.tolist()
+    return indices
+
+def clasificar_df(raw_df, company_id=None):
+    """Quita cuentas de total y agrega la columna sub_class"""
+    raw_df['accountName'] = raw_df['accountName'].str.strip()
+    df = raw_df[~marcar_totales(raw_df['accountName'])].copy()
+    df['sub_class'] = clasificar_serie(df['accountName'], df['type'], company_id)
+    return df
+
+def analizar_df(raw_df, company_id=None, vertical_format="records", horizontal_mode="first",
+                horizontal_base_year=None, horizontal_format="records", response_format="full",
+                sections=None, clasificado=False):
+    """Pipeline completo sobre el DataFrame de registros crudos.
+    sections limita qué partes se calculan y devuelven; response_format="slim" envía
+    las cuentas una sola vez en una tabla y los estados las referencian por posición.
+    clasificado=True: raw_df ya viene sin totales y con sub_class (libro mayor)."""
+    if raw_df.empty: return {"message": "Sin datos"}
+
+    cache = obtener_cache()
+    with etapa("cache", filas=len(raw_df)):
+        overrides = sorted(clasificador.OVERRIDES.get(company_id, {}).items())
+        clave = ("analisis", huella(
+            huella_filas(raw_df), company_id, overrides,
+            vertical_format, horizontal_mode, horizontal_base_year, horizontal_format,
+            response_format, sections
+        ))
+        resultado = cache.get(clave)
+    if resultado is not None: return resultado
+
+    if clasificado:
+        df = raw_df
+    else:
+        with etapa("clasificacion", filas=len(raw_df)):
+            df = clasificar_df(raw_df, company_id)
+
+    pedir = lambda seccion: sections is None or seccion in sections
+    slim = response_format == 'slim'
+    # Las listas de cuentas solo salen en los estados del formato full; slim las referencia por id
+    incluir_cuentas = pedir("financial_statements") and not slim
+
+    years = [int(y) for y in sorted(df['year'].unique())]
+    with etapa("estados", filas=len(df)):
+        financial_statements, huellas, saldos = estados_incrementales(df, cache, incluir_cuentas)
+
+    with etapa("ratios_flujos", filas=len(years)):
+        ratios_res, flujos_res = ratios_y_flujos(saldos, financial_statements, years, huellas, cache)
+
+    resultado = {}
+    if pedir("ratios"): resultado["ratios"] = ratios_res
+
+    if pedir("vertical"):
+        with etapa("vertical", filas=len(df)):
+            vertical_res = generar_analisis_vertical(df, financial_statements, slim or vertical_format == 'columnar')
+        # En slim los porcentajes quedan alineados con la tabla de cuentas
+        resultado["vertical"] = {"pct": vertical_res.get("pct", [])} if slim else vertical_res
+
+    if pedir("horizontal"):
+        with etapa("horizontal", filas=len(df)):
+            resultado["horizontal"] = generar_analisis_horizontal(
+                df, horizontal_mode, horizontal_base_year, slim or horizontal_format == 'columnar'
+            )
+
+    if pedir("flujo_efectivo"): resultado["flujo_efectivo"] = flujos_res # Ahora enviamos esto
+
+    if pedir("financial_statements"):
+        if slim:
+            with etapa("normalizacion", filas=len(df)):
+                dfv = df.sort_values('year', kind='stable')
+                indices = indices_por_grupo(dfv)
+                resultado["accounts"] = tabla_cuentas(dfv)
+                resultado["financial_statements"] = {
+                    y: estado_normalizado(st, indices.get(y, {})) for y, st in financial_statements.items()
+                }
+        else:
+            resultado["financial_statements"] = financial_statements
+
+    if pedir("proforma") or pedir("conclusion"):
+        with etapa("proforma"):
+            proforma_res = generar_proforma(financial_statements, years[0])
+        if pedir("proforma"): resultado["proforma"] = proforma_res
+
+    if pedir("conclusion"):
+        with etapa("conclusion"):
+            resultado["conclusion"] = generar_conclusion_experta(ratios_res, proforma_res, flujos_res, financial_statements)
+
+    if slim: resultado["format"] = "slim"
+    cache.set(clave, resultado)
+    return resultado
+
+def ratios_y_flujos(saldos, financial_statements, years, huellas, cache):
+    """Ratios y flujos por año; solo se recalculan si cambió su año o el anterior.
+    La tabla de capital de trabajo (a partir de los saldos de los estados) se arma
+    solo si algún año no está en la cache."""
+    ratios_res = []
+    flujos_res = []
+    capital = {}
+
+    def fila_capital(year):
+        if not capital:
+            capital.update(tabla_capital_trabajo(saldos))
+        return capital[year]
     
-    return reporte
+    for i, year in enumerate(years):
+        prev_stmt = financial_statements[years[i-1]] if i > 0 else None
+        h_prev = huellas[years[i-1]] if i > 0 else None
+        
+        # Ratios
+        clave_ratios = ("ratios", huellas[year], h_prev)
+        ratios = cache.get(clave_ratios)
+        if ratios is None:
+            ratios = calcular_ratios_completos(financial_statements, year, fila_capital(year))
+            cache.set(clave_ratios, ratios)
+        ratios_res.append(ratios)
+        
+        # Flujos (Requiere año anterior)
+        if prev_stmt:
+            clave_flujo = ("flujo", huellas[year], h_prev)
+            flujo = cache.get(clave_flujo)
+            if flujo is None:
+                flujo = generar_flujo_efectivo(financial_statements[year], fila_capital(year), year)
+                cache.set(clave_flujo, flujo)
+            flujos_res.append(flujo)
+
+    return ratios_res, flujos_res
+
+def cargar_registros(data: AnalysisRequest):
+    """DataFrame con los registros enviados más los de la ingesta referenciada"""
+    return con_ingesta(pd.DataFrame([r.dict() for r in data.records]), data.ingestion_id)
+
+def con_ingesta(raw_df, ingestion_id):
+    if not ingestion_id: return raw_df
+    try:
+        ingesta = obtener_ingesta(ingestion_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Ingesta no encontrada o expirada")
+    return pd.concat([ingesta, raw_df], ignore_index=True) if not raw_df.empty else ingesta
+
+def filas_peticion(data: AnalysisRequest):
+    """Tamaño aproximado del libro (registros enviados + ingesta referenciada)"""
+    ingesta = ingesta_guardada(data.ingestion_id) if data.ingestion_id else None
+    return len(data.records) + (len(ingesta) if ingesta is not None else 0)
+
+def ejecutar_analisis(raw_df, company_id, opciones, ruta="/analyze", clasificado=False):
+    medicion = medicion_actual()
+    try:
+        if medicion is not None and medicion.perfil:
+            perfil = {}
+            with perfilar(perfil):
+                resultado = analizar_df(raw_df, company_id, clasificado=clasificado, **opciones)
+            # Copia superficial: el resultado puede estar compartido con la cache
+            return respuesta_json({**resultado, "profile": perfil['profile'], "stages": medicion.etapas})
+        return respuesta_json(analizar_df(raw_df, company_id, clasificado=clasificado, **opciones))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error en %s: %s", ruta, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+def analizar_peticion(data: AnalysisRequest, opciones):
+    with etapa("carga", filas=len(data.records)):
+        raw_df = cargar_registros(data)
+    return ejecutar_analisis(raw_df, data.company_id, opciones)
 
 @app.post("/analyze")
-def analyze_financials(data: AnalysisRequest):
+async def analyze_financials(data: AnalysisRequest):
+    opciones = data.opciones()
+    return await elegir_carril(filas_peticion(data)).ejecutar(analizar_peticion, data, opciones)
+
+def analizar_columnar_peticion(cuerpo):
+    with etapa("carga"):
+        try:
+            payload = leer_json(cuerpo)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="JSON inválido")
+        if not isinstance(payload, dict):
+            raise HTTPException(status_code=400, detail="Se esperaba un objeto JSON")
+        try:
+            raw_df = dataframe_columnar(payload.pop('columns', None))
+            data = ColumnarAnalysisRequest(**payload)
+        except ErrorColumnas as e:
+            raise HTTPException(status_code=422, detail=e.errores)
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+        opciones = data.opciones()
+        raw_df = con_ingesta(raw_df, data.ingestion_id)
+    return ejecutar_analisis(raw_df, data.company_id, opciones, "/analyze/columnar")
+
+@app.post("/analyze/columnar")
+async def analyze_columnar(request: Request):
+    """Como /analyze, pero los registros llegan como arreglos paralelos en "columns"
+    y se validan en bloque, sin un modelo por línea: {"columns": {"accountName": [...],
+    "value": [...], "year": [...], "type": [...], "id": [...]}, "company_id": ..., ...}"""
+    cuerpo = await request.body()
+    # ~40 bytes por línea del libro en formato columnar
+    return await elegir_carril(len(cuerpo) // 40).ejecutar(analizar_columnar_peticion, cuerpo)
+
+def analizar_periodos_peticion(data: PeriodAnalysisRequest):
+    raw_df = pd.DataFrame([r.dict() for r in data.records])
+    if raw_df.empty: return {"message": "Sin datos"}
     try:
-        raw_df = pd.DataFrame([r.dict() for r in data.records])
-        if raw_df.empty: return {"message": "Sin datos"}
+        with etapa("clasificacion", filas=len(raw_df)):
+            df = clasificar_df(raw_df, data.company_id)
+        with etapa("periodos", filas=len(df)):
+            resultado = analizar_periodos(df, data.frequency, data.window_months)
+        return respuesta_json(resultado)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error en /analyze/periods: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        raw_df['accountName'] = raw_df['accountName'].str.strip()
-        df = raw_df[~raw_df['accountName'].apply(es_cuenta_total)].copy()
-        df['sub_class'] = df.apply(lambda x: clasificar_cuenta(x['accountName'], x['type']), axis=1)
+@app.post("/analyze/periods")
+async def analyze_periods(data: PeriodAnalysisRequest):
+    """Análisis mensual o trimestral con ratios y flujos sobre ventanas móviles"""
+    return await elegir_carril(len(data.records)).ejecutar(analizar_periodos_peticion, data)
 
-        years = [int(y) for y in sorted(df['year'].unique())]
-        financial_statements = generar_estados_financieros(df)
-        
-        ratios_res = []
-        vertical_res = []
-        flujos_res = []
-        
-        for i, year in enumerate(years):
-            prev_stmt = financial_statements[years[i-1]] if i > 0 else None
-            
-            # Ratios
-            ratios_res.append(calcular_ratios_completos(financial_statements, year, prev_stmt))
-            
-            # Flujos (Requiere año anterior)
-            if prev_stmt:
-                flujo = generar_flujo_efectivo(financial_statements[year], prev_stmt, year)
-                flujos_res.append(flujo)
-            
-            stmt = financial_statements[year]
-            base_act = stmt['balance_sheet']['assets']['total']
-            base_ven = stmt['income_statement']['net_sales']
-            
-            df_year = df[df['year'] == year]
-            for _, r in df_year.iterrows():
-                base = base_act if r['type'] in ['asset', 'liability', 'equity'] else base_ven
-                vertical_res.append({
-                    **r.to_dict(), 
-                    "value": float(r['value']),
-                    "year": int(r['year']),
-                    "pct": safe_div(r['value'], base)*100
-                })
-
-        horizontal_res = []
-        if len(years) >= 2:
-            base_year = years[0]
-            piv = df.pivot_table(index='accountName', columns='year', values='value', aggfunc='sum').fillna(0)
-            
-            for acc in piv.index:
-                val_base = to_float(piv.loc[acc, base_year])
-                for year in years[1:]:
-                    val_curr = to_float(piv.loc[acc, year])
-                    var_abs = val_curr - val_base
-                    var_pct = safe_div(var_abs, val_base) * 100
-                    
-                    horizontal_res.append({
-                        "period": f"{year} vs {base_year}", 
-                        "account": acc, 
-                        "val_base": val_base,
-                        "val_curr": val_curr,
-                        "var_abs": var_abs, 
-                        "var_pct": var_pct
-                    })
-
-        proforma_res = generar_proforma(financial_statements, years[0])
-
-        return {
-            "ratios": ratios_res,
-            "vertical": vertical_res,
-            "horizontal": horizontal_res,
-            "flujo_efectivo": flujos_res, # Ahora enviamos esto
-            "financial_statements": financial_statements,
-            "proforma": proforma_res,
-            "conclusion": generar_conclusion_experta(ratios_res, proforma_res)
-        }
+def clasificar_portafolio(companies):
+    """DataFrame clasificado de todas las empresas (columna company_id), o None sin datos"""
+    comunes = []
+    partes = []
+    with etapa("clasificacion"):
+        for company_id, req in companies.items():
+            raw_df = cargar_registros(req)
+            if raw_df.empty: continue
+            raw_df['company_id'] = company_id
+            cid = req.company_id or company_id
+            # Las empresas con overrides se clasifican aparte; el resto, en una sola pasada
+            if cid in clasificador.OVERRIDES: partes.append(clasificar_df(raw_df, cid))
+            else: comunes.append(raw_df)
+        if comunes:
+            partes.append(clasificar_df(pd.concat(comunes, ignore_index=True)))
+    return pd.concat(partes, ignore_index=True) if partes else None
+
+def portafolio_peticion(data: PortfolioRequest):
+    df = clasificar_portafolio(data.companies)
+    if df is None: return {"message": "Sin datos"}
+    try:
+        with etapa("panel", filas=len(df)):
+            resultado = analizar_portafolio(df, data.peer_groups, data.percentiles)
+        return respuesta_json(resultado)
     except Exception as e:
-        print(f"Error: {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error en /portfolio/ratios: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/portfolio/ratios")
+async def portfolio_ratios(data: PortfolioRequest):
+    """Razones de todas las empresas como panel, con percentiles por año y grupo de pares"""
+    filas = sum(filas_peticion(req) for req in data.companies.values())
+    return await elegir_carril(filas).ejecutar(portafolio_peticion, data)
+
+def escenarios_peticion(data: ScenarioRequest):
+    with etapa("carga", filas=len(data.records)):
+        raw_df = cargar_registros(data)
+    if raw_df.empty:
+        raise HTTPException(status_code=400, detail="Sin datos")
+    try:
+        cache = obtener_cache()
+        clave = None
+        if data.seed is not None:
+            overrides = sorted(clasificador.OVERRIDES.get(data.company_id, {}).items())
+            clave = ("escenarios", huella(huella_filas(raw_df), data.company_id, overrides,
+                                          data.years, data.paths, data.seed, data.percentiles))
+            resultado = cache.get(clave)
+            if resultado is not None: return respuesta_json(resultado)
+        with etapa("clasificacion", filas=len(raw_df)):
+            df = clasificar_df(raw_df, data.company_id)
+        with etapa("simulacion", filas=data.paths):
+            resultado = escenarios.simular_escenarios(df, data.years, data.paths, data.seed, data.percentiles)
+        if clave is not None: cache.set(clave, resultado)
+        return respuesta_json(resultado)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Error en /analyze/scenarios: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze/scenarios")
+async def analyze_scenarios(data: ScenarioRequest):
+    """Proyección Monte Carlo de varios años con bandas de percentiles"""
+    return await elegir_carril(filas_peticion(data)).ejecutar(escenarios_peticion, data)
+
+def conclusiones_peticion(data: ConclusionsRequest):
+    df = clasificar_portafolio(data.companies)
+    if df is None: return {"message": "Sin datos"}
+    try:
+        with etapa("metricas", filas=len(df)):
+            tabla = metricas_panel(df)
+        with etapa("reglas", filas=len(tabla)):
+            hallazgos = motor().hallazgos(tabla)
+        return respuesta_json({
+            "companies": int(tabla['company_id'].nunique()),
+            "findings": hallazgos,
+            "conclusions": conclusiones(tabla, hallazgos),
+        })
+    except Exception as e:
+        logger.exception("Error en /portfolio/conclusions: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/portfolio/conclusions")
+async def portfolio_conclusions(data: ConclusionsRequest):
+    """Reglas narrativas evaluadas sobre todas las empresas y años en una pasada"""
+    filas = sum(filas_peticion(req) for req in data.companies.values())
+    return await elegir_carril(filas).ejecutar(conclusiones_peticion, data)
+
+# --- LIBRO MAYOR PERSISTENTE ---
+
+def anexar_libro_peticion(company_id, data: LedgerAppendRequest):
+    raw_df = cargar_registros(data)
+    try:
+        return libro.anexar(company_id, raw_df)
+    except libro.AniosRepetidos as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except libro.ErrorLibro as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/ledger/{company_id}/append")
+async def ledger_append(company_id: str, data: LedgerAppendRequest):
+    """Anexa un lote de años nuevos (registros o ingestion_id) al libro de la empresa"""
+    return await elegir_carril(filas_peticion(data)).ejecutar(anexar_libro_peticion, company_id, data)
+
+@app.get("/ledger/{company_id}")
+def ledger_summary(company_id: str):
+    return libro.resumen(company_id)
+
+@app.delete("/ledger/{company_id}")
+def ledger_delete(company_id: str):
+    if not libro.eliminar(company_id):
+        raise HTTPException(status_code=404, detail="Empresa sin libro")
+    return {"company_id": company_id, "deleted": True}
+
+def analizar_libro_peticion(company_id, data: LedgerAnalysisRequest, opciones):
+    with etapa("carga"):
+        df = libro.leer(company_id, data.year_from, data.year_to)
+    if df.empty:
+        raise HTTPException(status_code=404, detail="Empresa sin registros en el rango pedido")
+    return ejecutar_analisis(df, company_id, opciones, "/ledger/analyze", clasificado=True)
+
+@app.post("/ledger/{company_id}/analyze")
+async def ledger_analyze(company_id: str, data: LedgerAnalysisRequest):
+    """Igual que /analyze pero leyendo el historial guardado en el libro, sin reenviarlo"""
+    opciones = data.opciones()
+    # El conteo (SQLite) decide el carril; corre en un hilo para no bloquear el event loop
+    filas = await asyncio.to_thread(libro.contar, company_id, data.year_from, data.year_to)
+    return await elegir_carril(filas).ejecutar(analizar_libro_peticion, company_id, data, opciones)
+
+# --- ANÁLISIS POR LOTES ---
+# Número de procesos del pool (por defecto, todos los núcleos)
+BATCH_WORKERS = int(os.environ.get("FINANZAS_BATCH_WORKERS", "0")) or os.cpu_count() or 1
+_pool = None
+
+def obtener_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS, mp_context=arranque.contexto_procesos())
+    return _pool
+
+def cerrar_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
+    reportes.cerrar_pool_reportes()
+    for carril in admision.CARRILES.values():
+        carril.cerrar()
+
+def sincronizar_overrides(company_id, overrides):
+    """Deja en el proceso los overrides que tenía la empresa en el servidor al encolar.
+    Los procesos del pool viven entre peticiones: None borra los que quedaron de antes."""
+    if overrides is None:
+        clasificador.OVERRIDES.pop(company_id, None)
+    else:
+        clasificador.OVERRIDES[company_id] = overrides
+
+def analizar_en_proceso(payload):
+    """Punto de entrada de cada proceso del pool. Recibe solo tipos básicos (picklables)."""
+    company_id = payload['company_id']
+    sincronizar_overrides(company_id, payload['overrides'])
+    return analizar_df(payload['df'], company_id, **payload['opciones'])
+
+@app.post("/analyze/batch")
+def analyze_batch(data: BatchAnalysisRequest):
+    """Analiza muchas empresas en el pool de procesos y devuelve NDJSON:
+    una línea por empresa en cuanto termina, con su resultado o su error."""
+    pool = obtener_pool()
+    futuros = {}
+    rechazadas = []
+    for company_id, cuerpo in data.companies.items():
+        try:
+            req = AnalysisRequest.model_validate(cuerpo)
+        except ValidationError as e:
+            rechazadas.append({"company_id": company_id, "status": "error",
+                               "detail": e.errors(include_url=False, include_context=False)})
+            continue
+        cid = req.company_id or company_id
+        try:
+            payload = {
+                "company_id": cid,
+                "df": cargar_registros(req),
+                "opciones": req.opciones(),
+                "overrides": clasificador.OVERRIDES.get(cid),
+            }
+        except HTTPException as e:
+            rechazadas.append({"company_id": company_id, "status": "error", "detail": e.detail})
+            continue
+        except ValueError as e:
+            rechazadas.append({"company_id": company_id, "status": "error", "detail": str(e)})
+            continue
+        futuros[pool.submit(analizar_en_proceso, payload)] = company_id
+
+    def resultados():
+        # Las empresas que no pasaron la validación no llegan al pool y se informan primero
+        for linea in rechazadas:
+            yield serializar(linea) + b"\n"
+        for futuro in as_completed(futuros):
+            company_id = futuros[futuro]
+            try:
+                linea = {"company_id": company_id, "status": "ok", "result": futuro.result()}
+            except Exception as e:
+                linea = {"company_id": company_id, "status": "error", "detail": str(e)}
+            yield serializar(linea) + b"\n"
+
+    return StreamingResponse(resultados(), media_type="application/x-ndjson")
+
+# --- REPORTES PDF ---
+def reporte_en_proceso(payload):
+    """Analiza y renderiza el PDF de una empresa dentro del pool de reportes"""
+    company_id = payload['company_id']
+    sincronizar_overrides(company_id, payload['overrides'])
+    resultado = analizar_df(payload['df'], company_id)
+    if 'message' in resultado:
+        raise ValueError(resultado['message'])
+    return reportes.renderizar_pdf(resultado, payload['ruta'], payload['titulo'])
+
+@app.post("/reports", status_code=202)
+def create_report(data: ReportRequest):
+    """Encola un reporte PDF por empresa y devuelve el job_id para consultar su estado.
+    Los registros se cargan antes de crear el job: una ingesta inexistente responde 404
+    sin dejar un job con empresas que nunca salen de "queued"."""
+    registros = {company_id: cargar_registros(req) for company_id, req in data.companies.items()}
+    job_id = reportes.crear_job(list(data.companies))
+    for company_id, req in data.companies.items():
+        cid = req.company_id or company_id
+        reportes.encolar(job_id, company_id, reporte_en_proceso, {
+            "company_id": cid,
+            "df": registros[company_id],
+            "overrides": clasificador.OVERRIDES.get(cid),
+            "ruta": reportes.ruta_pdf(job_id, company_id),
+            "titulo": data.title or f"Análisis Financiero - {company_id}",
+        })
+    return {"job_id": job_id, "status_url": f"/reports/{job_id}", "file_url": f"/reports/{job_id}/file"}
+
+@app.get("/reports/{job_id}")
+def report_status(job_id: str):
+    job = reportes.estado_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    return job
+
+@app.get("/reports/{job_id}/file")
+def report_file(job_id: str):
+    job = reportes.estado_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Reporte no encontrado")
+    if job['status'] != "done":
+        raise HTTPException(status_code=409, detail=f"Reporte en estado '{job['status']}'")
+    ruta, media_type = reportes.archivo_job(job_id)
+    extension = "pdf" if media_type == "application/pdf" else "zip"
+    return FileResponse(ruta, media_type=media_type, filename=f"reporte-{job_id[:8]}.{extension}")
+
 @app.post("/upload-csv")
-async def upload_csv(file: UploadFile = File(...)):
-    content = await file.read()
-    df = pd.read_csv(io.BytesIO(content))
-    return {"data": df.to_dict(orient='records')}
\ No newline at end of file
+async def upload_csv(file: UploadFile = File(...), store: bool = False):
+    """Lee el CSV por bloques (sin cargarlo entero) y devuelve las cuentas condensadas.
+    Con store=true solo devuelve un ingestion_id para usar en /analyze."""
+    # ~50 bytes por línea de CSV para estimar el carril
+    carril = elegir_carril((file.size or 0) // 50)
+    try:
+        condensado, resumen = await carril.ejecutar(ingerir_csv, file.file)
+    except (ErrorIngesta, pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if store:
+        return {"ingestion_id": guardar_ingesta(condensado), **resumen}
+    return {"data": condensado.to_dict(orient='records'), **resumen}
+
+@app.put("/classification/overrides/{company_id}")
+def put_overrides(company_id: str, overrides: List[ClassificationOverride]):
+    total = registrar_overrides(company_id, [o.dict() for o in overrides])
+    libro.reclasificar(company_id)
+    return {"company_id": company_id, "overrides": total}
+
+@app.delete("/classification/overrides/{company_id}")
+def delete_overrides(company_id: str):
+    if not eliminar_overrides(company_id):
+        raise HTTPException(status_code=404, detail="Empresa sin overrides")
+    libro.reclasificar(company_id)
+    return {"company_id": company_id, "deleted": True}
+
+@app.get("/classification/stats")
+def classification_stats():
+    return estadisticas_cache()
+
+@app.get("/cache/stats")
+def cache_stats():
+    return obtener_cache().stats()
+
+@app.delete("/cache")
+def cache_clear():
+    obtener_cache().clear()
+    return {"cleared": True}
+
+@app.get("/metrics")
+def metrics():
+    texto = exposicion_prometheus() + admision.exposicion_prometheus() + CALENTAMIENTO.exposicion_prometheus()
+    return PlainTextResponse(texto, media_type="text/plain; version=0.0.4")
+
+@app.get("/admission/stats")
+def admission_stats():
+    return {nombre: carril.stats() for nombre, carril in admision.CARRILES.items()}
+
+# --- ARRANQUE ---
+def libro_muestra():
+    """Libro de dos años con una cuenta por palabra clave de clasificador.REGLAS,
+    así el análisis de calentamiento pasa por todas las ramas de clasificación"""
+    cuentas = [(palabra.title(), tipo) for tipo, reglas in clasificador.REGLAS.items()
+               for _, palabras in reglas for palabra in (palabras or ["Otros"])]
+    cuentas += [("Ventas de Mercadería", "revenue"), ("Capital Social", "equity"), ("Total Activos", "asset")]
+    filas = [{"id": f"muestra-{year}-{i}", "accountName": nombre, "value": 1000.0 * (i + 1) * (1 + (year - 2023) / 10),
+              "year": year, "type": tipo}
+             for year in (2023, 2024) for i, (nombre, tipo) in enumerate(cuentas)]
+    return pd.DataFrame(filas)
+
+def calentar_importaciones():
+    for nombre in arranque.PRECARGA[:-1]:
+        importlib.import_module(nombre)
+
+def calentar_tablas():
+    """Tablas de clasificación (LRU) y reglas narrativas compiladas"""
+    clasificar_df(libro_muestra())
+    motor()
+
+def calentar_analisis():
+    # Primer paso por groupby/pivot/serialización de pandas y por el motor de reglas
+    respuesta_json(analizar_df(libro_muestra(), "__calentamiento__"))
+
+def proceso_listo(_):
+    return os.getpid()
+
+def calentar_pools():
+    """Arranca la plantilla forkserver y los procesos del pool de lotes antes de la primera petición"""
+    if not arranque.CALENTAR_POOLS: return
+    list(obtener_pool().map(proceso_listo, range(BATCH_WORKERS)))
+
+CALENTAMIENTO = arranque.Calentamiento([
+    ("importaciones", calentar_importaciones),
+    ("tablas", calentar_tablas),
+    ("analisis", calentar_analisis),
+    ("pools", calentar_pools),
+])
+
+@app.get("/ready")
+def ready():
+    """200 cuando terminó el calentamiento de arranque, 503 mientras tanto"""
+    estado = CALENTAMIENTO.stats()
+    return JSONResponse(estado, status_code=200 if estado["ready"] else 503)
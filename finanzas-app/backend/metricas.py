@@ -0,0 +1,169 @@
+"""Instrumentación por etapa del pipeline: tiempo, filas y memoria pico.
+
+Cada petición lleva su propia Medicion en una ContextVar; las etapas se registran con
+`with etapa("nombre", filas=n):`. Al terminar, la medición alimenta los histogramas
+globales que expone /metrics (formato texto de Prometheus) y la cabecera Server-Timing.
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# tracemalloc es global al proceso y multiplica el tiempo de pandas varias veces, por eso
+# solo se enciende con esta variable o en peticiones con perfilado. Con peticiones
+# concurrentes el pico de memoria por etapa es aproximado.
+MEDIR_MEMORIA = os.environ.get("FINANZAS_MEDIR_MEMORIA", "0") == "1"
+
+BUCKETS_SEGUNDOS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+BUCKETS_BYTES = [2 ** n for n in range(16, 32, 2)] # 64 KiB .. 1 GiB
+
+_medicion = ContextVar("medicion", default=None)
+
+class Medicion:
+    def __init__(self, memoria=MEDIR_MEMORIA, perfil=False):
+        self.etapas = []
+        self.memoria = memoria
+        self.perfil = perfil
+
+    def server_timing(self):
+        partes = []
+        for e in self.etapas:
+            parte = f"{e['etapa']};dur={e['segundos'] * 1000:.2f}"
+            if e['filas'] is not None:
+                parte += f';desc="filas={e["filas"]}"'
+            partes.append(parte)
+        return ", ".join(partes)
+
+class Histograma:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.conteos = [0] * (len(buckets) + 1)
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor):
+        i = 0
+        while i < len(self.buckets) and valor > self.buckets[i]:
+            i += 1
+        self.conteos[i] += 1
+        self.suma += valor
+        self.total += 1
+
+    def lineas(self, nombre, etiquetas):
+        acumulado = 0
+        for limite, conteo in zip(self.buckets + ["+Inf"], self.conteos):
+            acumulado += conteo
+            yield f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulado}'
+        yield f"{nombre}_sum{{{etiquetas}}} {self.suma}"
+        yield f"{nombre}_count{{{etiquetas}}} {self.total}"
+
+_lock = threading.Lock()
+_duraciones = {}
+_memoria = {}
+_filas = {}
+
+def _registrar(e):
+    with _lock:
+        _duraciones.setdefault(e['etapa'], Histograma(BUCKETS_SEGUNDOS)).observar(e['segundos'])
+        if e['filas'] is not None:
+            _filas[e['etapa']] = _filas.get(e['etapa'], 0) + e['filas']
+        if e['memoria_pico'] is not None:
+            _memoria.setdefault(e['etapa'], Histograma(BUCKETS_BYTES)).observar(e['memoria_pico'])
+
+def iniciar_medicion(memoria=MEDIR_MEMORIA, perfil=False):
+    medicion = Medicion(memoria, perfil)
+    return medicion, _medicion.set(medicion)
+
+def terminar_medicion(token):
+    _medicion.reset(token)
+
+def medicion_actual():
+    return _medicion.get()
+
+@contextmanager
+def etapa(nombre, filas=None):
+    """Registra una etapa en la medición activa (no hace nada fuera de una petición)"""
+    medicion = _medicion.get()
+    if medicion is None:
+        yield
+        return
+    memoria = medicion.memoria and tracemalloc.is_tracing()
+    if memoria:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        registro = {
+            "etapa": nombre,
+            "segundos": time.perf_counter() - t0,
+            "filas": None if filas is None else int(filas),
+            "memoria_pico": tracemalloc.get_traced_memory()[1] - base if memoria else None,
+        }
+        medicion.etapas.append(registro)
+        _registrar(registro)
+
+_trazas_activas = 0
+_traza_propia = False
+
+@contextmanager
+def trazar_memoria(activo=True):
+    """Mantiene tracemalloc encendido mientras haya algún bloque activo que lo pida"""
+    global _trazas_activas, _traza_propia
+    if not activo:
+        yield
+        return
+    with _lock:
+        if _trazas_activas == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _traza_propia = True
+        _trazas_activas += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _trazas_activas -= 1
+            if _trazas_activas == 0 and _traza_propia:
+                tracemalloc.stop()
+                _traza_propia = False
+
+@contextmanager
+def perfilar(destino, limite=30):
+    """cProfile del bloque; deja en destino['profile'] las funciones con más tiempo acumulado"""
+    perfil = cProfile.Profile()
+    perfil.enable()
+    try:
+        yield
+    finally:
+        perfil.disable()
+        salida = io.StringIO()
+        pstats.Stats(perfil, stream=salida).sort_stats('cumulative').print_stats(limite)
+        destino['profile'] = salida.getvalue()
+
+def exposicion_prometheus():
+    lineas = [
+        "# HELP finanzas_stage_seconds Duración de cada etapa del análisis",
+        "# TYPE finanzas_stage_seconds histogram",
+    ]
+    with _lock:
+        for nombre, h in sorted(_duraciones.items()):
+            lineas.extend(h.lineas("finanzas_stage_seconds", f'stage="{nombre}"'))
+        lineas += [
+            "# HELP finanzas_stage_peak_memory_bytes Memoria pico asignada durante la etapa",
+            "# TYPE finanzas_stage_peak_memory_bytes histogram",
+        ]
+        for nombre, h in sorted(_memoria.items()):
+            lineas.extend(h.lineas("finanzas_stage_peak_memory_bytes", f'stage="{nombre}"'))
+        lineas += [
+            "# HELP finanzas_stage_rows_total Filas procesadas por etapa",
+            "# TYPE finanzas_stage_rows_total counter",
+        ]
+        for nombre, n in sorted(_filas.items()):
+            lineas.append(f'finanzas_stage_rows_total{{stage="{nombre}"}} {n}')
+    return "\n".join(lineas) + "\n"
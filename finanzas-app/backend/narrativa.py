@@ -0,0 +1,196 @@
+"""Motor de conclusiones narrativas.
+
+Las reglas son declarativas: cada una lee una métrica (una columna de la tabla de
+métricas), define un intervalo y una plantilla de texto. Al compilar el motor, las
+reglas se indexan por métrica y sus límites quedan en arreglos, así que la evaluación
+es una sola comparación (filas x reglas) con broadcasting sobre toda la serie de
+empresa-año; no hay un bucle por regla ni por empresa. Solo los aciertos se redactan,
+con plantillas validadas y ligadas una vez.
+
+La tabla de métricas tiene una fila por (company_id, year) con las razones aplanadas
+('rentabilidad.roe', ...), señales del flujo de efectivo ('flujo.total_operacion', ...),
+resultados ('resultados.ventas', ...) y tendencias derivadas: 'var.<razón>' (diferencia
+contra el año anterior) y 'crecimiento.<resultado>' (variación % horizontal).
+"""
+import functools
+import math
+import string
+
+from arranque import diferido
+
+from razones import calcular_razones, aplanar
+from periodos import estados_por_periodo, agregar_resultados, flujo_efectivo_ventana, FLUJOS
+from panel import matriz_panel, valores_panel
+
+np = diferido("numpy")
+pd = diferido("pandas")
+
+INF = math.inf
+
+# (id, métrica, desde, hasta, incluye_desde, incluye_hasta, severidad, plantilla)
+# Las reglas de una misma métrica no se solapan cuando son alternativas (if/elif).
+REGLAS = [
+    ("roe_excelente", "rentabilidad.roe", 20, INF, False, True, "positivo",
+     "• Rentabilidad (ROE): {valor:.2f}%. Excelente rendimiento sobre el patrimonio."),
+    ("roe_aceptable", "rentabilidad.roe", 10, 20, False, True, "neutral",
+     "• Rentabilidad (ROE): {valor:.2f}%. Rendimiento aceptable."),
+    ("roe_bajo", "rentabilidad.roe", -INF, 10, True, True, "alerta",
+     "• Rentabilidad (ROE): {valor:.2f}%. Rendimiento bajo, revisar margen y rotación."),
+    ("liquidez_exceso", "liquidez.razon_circulante", 2, INF, False, True, "neutral",
+     "• Liquidez (Razón Circulante): {valor:.2f}. Exceso de liquidez o inventario ocioso."),
+    ("liquidez_suficiente", "liquidez.razon_circulante", 1, 2, True, True, "positivo",
+     "• Liquidez (Razón Circulante): {valor:.2f}. Liquidez suficiente para cubrir obligaciones CP."),
+    ("liquidez_problemas", "liquidez.razon_circulante", -INF, 1, True, False, "alerta",
+     "• Liquidez (Razón Circulante): {valor:.2f}. Problemas potenciales de liquidez."),
+    ("prueba_acida_baja", "liquidez.razon_rapida", -INF, 0.5, True, False, "alerta",
+     "• Razón rápida de {valor:.2f}: sin inventarios el activo corriente no cubre el pasivo corriente."),
+    ("cno_negativo", "liquidez.cno", -INF, 0, True, False, "neutral",
+     "• CNO negativo ({valor:,.2f}): los proveedores financian la operación."),
+    ("ciclo_largo", "ciclo_efectivo.ciclo_conversion", 120, INF, False, True, "alerta",
+     "• Ciclo de conversión del efectivo de {valor:.0f} días: capital atrapado en inventarios y cartera."),
+    ("ciclo_negativo", "ciclo_efectivo.ciclo_conversion", -INF, 0, True, False, "positivo",
+     "• Ciclo de conversión del efectivo negativo ({valor:.0f} días): se cobra antes de pagar a proveedores."),
+    ("cobro_lento", "actividad.periodo_cobro", 90, INF, False, True, "alerta",
+     "• Periodo de cobro de {valor:.0f} días: revisar la política de crédito."),
+    ("endeudamiento_alto", "endeudamiento.razon_endeudamiento", 70, INF, False, True, "alerta",
+     "• Endeudamiento de {valor:.2f}% sobre activos: apalancamiento alto."),
+    ("cobertura_negativa", "endeudamiento.cobertura_intereses", -INF, 0, True, False, "alerta",
+     "• Cobertura de intereses de {valor:.2f}x: la operación no genera para pagar intereses."),
+    ("cobertura_baja", "endeudamiento.cobertura_intereses", 0, 1.5, False, False, "alerta",
+     "• Cobertura de intereses de {valor:.2f}x: la utilidad operativa apenas cubre los intereses."),
+    ("margen_negativo", "rentabilidad.margen_neto", -INF, 0, True, False, "alerta",
+     "• Margen neto negativo ({valor:.2f}%): la empresa pierde dinero en sus ventas."),
+    ("margen_cae", "var.rentabilidad.margen_neto", -INF, -5, True, False, "alerta",
+     "• Caída del margen neto frente al año anterior: {valor:+.2f} puntos."),
+    ("margen_mejora", "var.rentabilidad.margen_neto", 5, INF, False, True, "positivo",
+     "• Mejora del margen neto frente al año anterior: {valor:+.2f} puntos."),
+    ("roe_cae", "var.rentabilidad.roe", -INF, -10, True, False, "alerta",
+     "• Caída del ROE frente al año anterior: {valor:+.2f} puntos."),
+    ("ventas_caen", "crecimiento.ventas", -INF, -10, True, False, "alerta",
+     "• Caída de las ventas frente al año anterior: {valor:+.2f}%."),
+    ("ventas_crecen", "crecimiento.ventas", 20, INF, False, True, "positivo",
+     "• Crecimiento de las ventas frente al año anterior: {valor:+.2f}%."),
+    ("flujo_operativo_negativo", "flujo.total_operacion", -INF, 0, True, False, "alerta",
+     "• Flujo de operación negativo ({valor:,.2f}): la operación consume efectivo."),
+    ("caja_negativa", "flujo.saldo_final_calculado", -INF, 0, True, False, "alerta",
+     "• El saldo de caja calculado cierra en negativo ({valor:,.2f}): se necesita financiamiento."),
+]
+
+# Métricas cuya variación contra el año anterior se agrega como 'var.<métrica>'
+TENDENCIAS = ['rentabilidad.roe', 'rentabilidad.margen_neto', 'liquidez.razon_circulante']
+CRECIMIENTOS = {'crecimiento.ventas': 'resultados.ventas', 'crecimiento.utilidad_neta': 'resultados.utilidad_neta'}
+
+def _compilar_plantilla(texto):
+    campos = {campo for _, campo, _, _ in string.Formatter().parse(texto) if campo}
+    if not campos <= {'valor', 'year'}:
+        raise ValueError(f"Campos desconocidos en la plantilla: {campos - {'valor', 'year'}}")
+    return texto.format
+
+class MotorReglas:
+    """Reglas compiladas: índice por métrica y límites en arreglos para evaluar todo junto"""
+
+    def __init__(self, reglas=REGLAS):
+        self.ids = [r[0] for r in reglas]
+        self.metricas = list(dict.fromkeys(r[1] for r in reglas))
+        self.indice = {}
+        for i, r in enumerate(reglas):
+            self.indice.setdefault(r[1], []).append(i)
+        posicion = {m: j for j, m in enumerate(self.metricas)}
+        self.columna = np.array([posicion[r[1]] for r in reglas], dtype=np.intp)
+        self.desde = np.array([r[2] for r in reglas], dtype=float)
+        self.hasta = np.array([r[3] for r in reglas], dtype=float)
+        self.incluye_desde = np.array([r[4] for r in reglas], dtype=bool)
+        self.incluye_hasta = np.array([r[5] for r in reglas], dtype=bool)
+        self.severidad = np.array([r[6] for r in reglas], dtype=object)
+        self.plantillas = [_compilar_plantilla(r[7]) for r in reglas]
+
+    def reglas_de(self, metrica):
+        return [self.ids[i] for i in self.indice.get(metrica, [])]
+
+    def evaluar(self, tabla):
+        """tabla: DataFrame con una columna por métrica (las faltantes no disparan reglas).
+        Devuelve (filas, reglas, valores) de los aciertos, en orden de fila y de regla."""
+        valores = tabla.reindex(columns=self.metricas).to_numpy(dtype=float)
+        x = valores[:, self.columna] # filas x reglas
+        sobre = np.where(self.incluye_desde, x >= self.desde, x > self.desde)
+        bajo = np.where(self.incluye_hasta, x <= self.hasta, x < self.hasta)
+        filas, reglas = np.nonzero(sobre & bajo) # NaN nunca cumple
+        return filas, reglas, x[filas, reglas]
+
+    def hallazgos(self, tabla):
+        """Aciertos redactados en forma columnar, con company_id y year de cada fila"""
+        filas, reglas, valores = self.evaluar(tabla)
+        years = tabla['year'].to_numpy()[filas]
+        return {
+            "company_id": tabla['company_id'].to_numpy()[filas].tolist(),
+            "year": [int(y) for y in years],
+            "rule": [self.ids[r] for r in reglas],
+            "metric": [self.metricas[self.columna[r]] for r in reglas],
+            "severity": self.severidad[reglas].tolist(),
+            "value": valores.tolist(),
+            "text": [self.plantillas[r](valor=v, year=int(y)) for r, v, y in zip(reglas, valores, years)],
+        }
+
+@functools.lru_cache(maxsize=None)
+def motor():
+    """Motor con REGLAS, compilado en el primer uso (o en el calentamiento de arranque)"""
+    return MotorReglas()
+
+def agregar_tendencias(tabla):
+    """Agrega 'var.*' y 'crecimiento.*' comparando cada año con el anterior de la misma empresa"""
+    tabla = tabla.sort_values(['company_id', 'year'], kind='stable').reset_index(drop=True)
+    presentes = [c for c in TENDENCIAS if c in tabla.columns]
+    origen = presentes + [c for c in CRECIMIENTOS.values() if c in tabla.columns]
+    anterior = tabla.groupby('company_id', sort=False)[origen].shift(1)
+    nuevas = {f"var.{c}": tabla[c] - anterior[c] for c in presentes}
+    for destino, fuente in CRECIMIENTOS.items():
+        if fuente not in tabla.columns: continue
+        base = anterior[fuente].where(anterior[fuente] != 0)
+        nuevas[destino] = (tabla[fuente] - base) / base.abs() * 100
+    return pd.concat([tabla, pd.DataFrame(nuevas, index=tabla.index)], axis=1)
+
+def metricas_empresa(ratios, flujos=(), statements=None, company_id="empresa"):
+    """Tabla de métricas de una empresa a partir de ratios, flujos y estados de /analyze"""
+    flujos_por_year = {f['year']: f['indirecto'] for f in flujos}
+    filas = []
+    for r in ratios:
+        year = r['year']
+        fila = {"company_id": company_id, "year": year,
+                **aplanar({k: v for k, v in r.items() if k != 'year'})}
+        if statements is not None:
+            inc = statements[year]['income_statement']
+            fila["resultados.ventas"] = inc['net_sales']
+            fila["resultados.utilidad_neta"] = inc['net_income']
+        flujo = flujos_por_year.get(year)
+        if flujo is not None:
+            fila["flujo.total_operacion"] = flujo['total_operacion']
+            fila["flujo.flujo_neto_periodo"] = flujo['resumen']['flujo_neto_periodo']
+            fila["flujo.saldo_final_calculado"] = flujo['resumen']['saldo_final_calculado']
+        filas.append(fila)
+    return agregar_tendencias(pd.DataFrame(filas))
+
+def metricas_panel(df):
+    """Tabla de métricas de todo un portafolio (df clasificado con company_id), vectorizada"""
+    m = matriz_panel(df)
+    cierre = estados_por_periodo(m)
+    resultados = agregar_resultados({k: cierre[k] for k in FLUJOS})
+    saldos = pd.DataFrame({k: v for k, v in cierre.items() if k not in FLUJOS}, index=m.index)
+    inicio = {k: v.to_numpy() for k, v in saldos.groupby(level='company_id').shift(1).items()}
+    flujo = flujo_efectivo_ventana(resultados, cierre, inicio)['indirecto']
+    tabla = pd.DataFrame({
+        **aplanar(calcular_razones(valores_panel(m))),
+        "resultados.ventas": resultados['net_sales'],
+        "resultados.utilidad_neta": resultados['net_income'],
+        "flujo.total_operacion": flujo['total_operacion'],
+        "flujo.flujo_neto_periodo": flujo['flujo_neto_periodo'],
+        "flujo.saldo_final_calculado": flujo['saldo_final_calculado'],
+    }, index=m.index).reset_index()
+    return agregar_tendencias(tabla)
+
+def conclusiones(tabla, hallazgos):
+    """{company_id: texto del último año de la empresa} en el formato de generar_conclusion_experta"""
+    ultimo = {cid: int(y) for cid, y in tabla.groupby('company_id', sort=False)['year'].max().items()}
+    lineas = {cid: [] for cid in ultimo}
+    for cid, year, texto in zip(hallazgos['company_id'], hallazgos['year'], hallazgos['text']):
+        if year == ultimo[cid]: lineas[cid].append(texto)
+    return {cid: "\n".join([f"DIAGNÓSTICO {ultimo[cid]}:"] + t) for cid, t in lineas.items()}
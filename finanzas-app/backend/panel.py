@@ -0,0 +1,98 @@
+"""Razones de todo un portafolio como un panel empresa x año.
+
+Todas las cuentas clasificadas de todas las empresas se agregan en una sola matriz
+(company_id, year) x (type, sub_class); los totales de estado, los promedios con el año
+anterior (shift por empresa) y las razones se calculan como operaciones de columna.
+Las estadísticas por año y grupo de pares salen del mismo DataFrame de razones.
+"""
+from arranque import diferido
+
+from razones import calcular_razones, aplanar, suma_subclases, SUBS_AC, SUBS_ANC, SUBS_PC, SUBS_PNC
+
+np = diferido("numpy")
+pd = diferido("pandas")
+
+PERCENTILES = [10, 25, 50, 75, 90]
+
+def matriz_panel(df):
+    """df clasificado con company_id -> matriz (company_id, year) x (type, sub_class)"""
+    return (df.groupby(['company_id', 'year', 'type', 'sub_class'])['value'].sum()
+              .unstack(['type', 'sub_class'], fill_value=0.0).sort_index())
+
+def valores_panel(m):
+    """Entradas de calcular_razones para cada fila del panel.
+    Los promedios usan el año anterior disponible de la misma empresa."""
+    ventas = suma_subclases(m, 'revenue')
+    cogs = suma_subclases(m, 'expense', ['cogs'])
+    utilidad_bruta = ventas - cogs
+    utilidad_op = utilidad_bruta - suma_subclases(m, 'expense', ['operating_expense']) - suma_subclases(m, 'expense', ['depreciation'])
+    intereses = suma_subclases(m, 'expense', ['interest'])
+    utilidad_neta = utilidad_op - intereses - suma_subclases(m, 'expense', ['tax'])
+
+    ac = suma_subclases(m, 'asset', SUBS_AC)
+    af = suma_subclases(m, 'asset', SUBS_ANC)
+    saldos = pd.DataFrame({
+        'inv': suma_subclases(m, 'asset', ['inventory']),
+        'cxc': suma_subclases(m, 'asset', ['receivables']),
+        'cxp': suma_subclases(m, 'liability', ['payables']),
+        'af': af,
+        'at': ac + af,
+    }, index=m.index)
+    anteriores = saldos.groupby(level='company_id').shift(1)
+    # Sin año anterior el promedio es el saldo actual (igual que calcular_ratios_completos)
+    promedios = ((saldos + anteriores) / 2).fillna(saldos)
+
+    return {
+        "ac": ac, "pc": suma_subclases(m, 'liability', SUBS_PC),
+        "inv": saldos['inv'].to_numpy(), "cxc": saldos['cxc'].to_numpy(), "cxp": saldos['cxp'].to_numpy(),
+        "af": af, "at": saldos['at'].to_numpy(),
+        "pasivo": suma_subclases(m, 'liability', SUBS_PC) + suma_subclases(m, 'liability', SUBS_PNC),
+        "patrimonio": suma_subclases(m, 'equity') + utilidad_neta,
+        "ventas": ventas, "costo_ventas": cogs,
+        "utilidad_bruta": utilidad_bruta, "utilidad_op": utilidad_op,
+        "utilidad_neta": utilidad_neta, "intereses": intereses,
+        "prom_inv": promedios['inv'].to_numpy(), "prom_cxc": promedios['cxc'].to_numpy(),
+        "prom_cxp": promedios['cxp'].to_numpy(),
+        "prom_af": promedios['af'].to_numpy(), "prom_at": promedios['at'].to_numpy(),
+    }
+
+def razones_panel(df):
+    """DataFrame con company_id, year y una columna por razón ('liquidez.cnt', ...)"""
+    m = matriz_panel(df)
+    razones = aplanar(calcular_razones(valores_panel(m)))
+    return pd.DataFrame(razones, index=m.index).reset_index()
+
+def grupo_de_pares(company_ids, grupos):
+    return company_ids.map(grupos).fillna('todos') if grupos else pd.Series('todos', index=company_ids.index)
+
+def estadisticas_panel(razones, grupos=None, percentiles=PERCENTILES):
+    """Percentiles, media y desviación de cada razón por (year, peer_group), más el
+    percentil de cada empresa dentro de su grupo. grupos: {company_id: peer_group}."""
+    columnas = [c for c in razones.columns if c not in ('company_id', 'year')]
+    razones = razones.assign(peer_group=grupo_de_pares(razones['company_id'], grupos))
+    agrupado = razones.groupby(['year', 'peer_group'])[columnas]
+
+    partes = {'count': agrupado.count(), 'mean': agrupado.mean(), 'std': agrupado.std(ddof=0)}
+    for p in percentiles:
+        partes[f"p{p:g}"] = agrupado.quantile(p / 100)
+    # Filas: (year, peer_group, ratio); columnas: count, mean, std, p10...
+    stats = pd.concat({k: v.stack() for k, v in partes.items()}, axis=1)
+    stats.index.names = ['year', 'peer_group', 'ratio']
+
+    rangos = agrupado.rank(pct=True) * 100
+    return stats.reset_index(), rangos.add_prefix('percentil.')
+
+def _columnar(df):
+    return {c: df[c].tolist() for c in df.columns}
+
+def analizar_portafolio(df, grupos=None, percentiles=PERCENTILES):
+    """df clasificado de todas las empresas (columna company_id) -> razones y estadísticas"""
+    razones = razones_panel(df)
+    stats, rangos = estadisticas_panel(razones, grupos, percentiles)
+    filas = pd.concat([razones, rangos], axis=1)
+    filas.insert(2, 'peer_group', grupo_de_pares(filas['company_id'], grupos))
+    return {
+        "companies": int(razones['company_id'].nunique()),
+        "rows": _columnar(filas.replace({np.nan: None})),
+        "stats": stats.replace({np.nan: None}).to_dict('records'),
+    }
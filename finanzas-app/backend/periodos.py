@@ -0,0 +1,181 @@
+"""Motor por periodos (mes o trimestre) con ventanas móviles.
+
+Se arma una sola matriz periodo x (type, sub_class). Las cuentas de resultados son
+flujos del periodo y se acumulan en ventanas de doce meses (TTM) con rolling(); las de
+balance son saldos al cierre, y la comparación con el inicio de la ventana se hace con
+shift(). Así todas las ventanas salen de una pasada, sin volver a correr el pipeline
+para cada una y sin buscar "el año anterior" estado por estado.
+"""
+from arranque import diferido
+
+from razones import calcular_razones, aplanar, suma_subclases, SUBS_AC, SUBS_ANC, SUBS_PC, SUBS_PNC
+
+np = diferido("numpy")
+pd = diferido("pandas")
+
+FRECUENCIAS = {'month': 12, 'quarter': 4} # periodos por año
+TIPOS_FLUJO = ['revenue', 'expense']
+
+def matriz_periodos(df, frecuencia='month'):
+    """DataFrame con índice de periodos contiguos y columnas (type, sub_class).
+    Flujos sin movimiento valen 0; saldos faltantes arrastran el último cierre conocido."""
+    if frecuencia not in FRECUENCIAS:
+        raise ValueError(f"Frecuencia inválida: {frecuencia}")
+    if df['month'].isna().any() or not df['month'].between(1, 12).all():
+        raise ValueError("Todos los registros necesitan un mes entre 1 y 12")
+
+    meses = pd.PeriodIndex(
+        pd.to_datetime(pd.DataFrame({'year': df['year'], 'month': df['month'], 'day': 1})), freq='M'
+    )
+    m = df.groupby([meses, df['type'], df['sub_class']])['value'].sum().unstack(['type', 'sub_class'], fill_value=0.0)
+    m = m.reindex(pd.period_range(m.index.min(), m.index.max(), freq='M'))
+
+    es_flujo = m.columns.get_level_values('type').isin(TIPOS_FLUJO)
+    m.loc[:, es_flujo] = m.loc[:, es_flujo].fillna(0.0)
+    m.loc[:, ~es_flujo] = m.loc[:, ~es_flujo].ffill().fillna(0.0)
+
+    if frecuencia == 'quarter':
+        trimestres = m.index.asfreq('Q')
+        flujos = m.loc[:, es_flujo].groupby(trimestres).sum()
+        saldos = m.loc[:, ~es_flujo].groupby(trimestres).last()
+        m = pd.concat([flujos, saldos], axis=1)
+    return m
+
+def estados_por_periodo(m):
+    """Totales de estado de resultados (flujo del periodo) y de balance (cierre) por periodo"""
+    ventas = suma_subclases(m, 'revenue')
+    cogs = suma_subclases(m, 'expense', ['cogs'])
+    depreciacion = suma_subclases(m, 'expense', ['depreciation'])
+    gastos_op = suma_subclases(m, 'expense', ['operating_expense'])
+    intereses = suma_subclases(m, 'expense', ['interest'])
+    impuestos = suma_subclases(m, 'expense', ['tax'])
+    return {
+        "net_sales": ventas,
+        "cogs": cogs,
+        "operating_expenses": gastos_op,
+        "depreciation": depreciacion,
+        "interest_expense": intereses,
+        "taxes": impuestos,
+        "cash": suma_subclases(m, 'asset', ['cash']),
+        "receivables": suma_subclases(m, 'asset', ['receivables']),
+        "inventory": suma_subclases(m, 'asset', ['inventory']),
+        "current_assets": suma_subclases(m, 'asset', SUBS_AC),
+        "non_current_assets": suma_subclases(m, 'asset', SUBS_ANC),
+        "payables": suma_subclases(m, 'liability', ['payables']),
+        "current_liabilities": suma_subclases(m, 'liability', SUBS_PC),
+        "non_current_liabilities": suma_subclases(m, 'liability', SUBS_PNC),
+        "equity_social": suma_subclases(m, 'equity'),
+    }
+
+def agregar_resultados(e):
+    """Subtotales del estado de resultados a partir de los flujos (sirve para periodo o TTM)"""
+    utilidad_bruta = e['net_sales'] - e['cogs']
+    utilidad_op = utilidad_bruta - e['operating_expenses'] - e['depreciation']
+    utilidad_neta = utilidad_op - e['interest_expense'] - e['taxes']
+    return {**e, "gross_profit": utilidad_bruta, "operating_income": utilidad_op, "net_income": utilidad_neta}
+
+FLUJOS = ['net_sales', 'cogs', 'operating_expenses', 'depreciation', 'interest_expense', 'taxes']
+
+def ventanas(e, ventana):
+    """Flujos acumulados en la ventana (TTM) y saldos al inicio de la ventana"""
+    ttm = {k: pd.Series(e[k]).rolling(ventana, min_periods=ventana).sum().to_numpy() for k in FLUJOS}
+    inicio = {k: pd.Series(v).shift(ventana).to_numpy() for k, v in e.items() if k not in FLUJOS}
+    return agregar_resultados(ttm), inicio
+
+def flujo_efectivo_ventana(ttm, cierre, inicio):
+    """generar_flujo_efectivo en forma vectorizada: variaciones contra el inicio de la ventana"""
+    var_cxc = cierre['receivables'] - inicio['receivables']
+    var_inv = cierre['inventory'] - inicio['inventory']
+    var_cxp = cierre['payables'] - inicio['payables']
+    operacion = ttm['net_income'] + ttm['depreciation'] - var_cxc - var_inv + var_cxp
+    inversion = -(cierre['non_current_assets'] - inicio['non_current_assets'])
+    var_deuda_lp = cierre['non_current_liabilities'] - inicio['non_current_liabilities']
+    var_capital = cierre['equity_social'] - inicio['equity_social']
+    financiamiento = var_deuda_lp + var_capital
+    neto = operacion + inversion + financiamiento
+
+    cobros = ttm['net_sales'] - var_cxc
+    pagos_proveedores = -(ttm['cogs'] + var_inv - var_cxp)
+    directo = cobros + pagos_proveedores - ttm['operating_expenses'] - ttm['interest_expense'] - ttm['taxes']
+    return {
+        "indirecto": {
+            "utilidad_neta": ttm['net_income'],
+            "depreciacion": ttm['depreciation'],
+            "var_cxc": var_cxc,
+            "var_inventarios": var_inv,
+            "var_cxp": var_cxp,
+            "total_operacion": operacion,
+            "total_inversion": inversion,
+            "var_deuda_lp": var_deuda_lp,
+            "var_capital": var_capital,
+            "total_financiamiento": financiamiento,
+            "flujo_neto_periodo": neto,
+            "saldo_inicial": inicio['cash'],
+            "saldo_final_calculado": inicio['cash'] + neto,
+        },
+        "directo": {
+            "cobros_clientes": cobros,
+            "pagos_proveedores": pagos_proveedores,
+            "flujo_operativo": directo,
+        },
+    }
+
+def razones_ventana(ttm, cierre, inicio):
+    """Ratios con flujos TTM y saldos promedio (cierre + inicio de ventana) / 2.
+    Sin inicio de ventana se usa el saldo de cierre, como en el análisis anual."""
+    ac = cierre['current_assets']
+    af = cierre['non_current_assets']
+    at = ac + af
+    pasivo = cierre['current_liabilities'] + cierre['non_current_liabilities']
+    at_inicio = inicio['current_assets'] + inicio['non_current_assets']
+
+    def promedio(actual, anterior):
+        return np.where(np.isnan(anterior), actual, (actual + anterior) / 2)
+
+    return calcular_razones({
+        "ac": ac, "pc": cierre['current_liabilities'],
+        "inv": cierre['inventory'], "cxc": cierre['receivables'], "cxp": cierre['payables'],
+        "af": af, "at": at, "pasivo": pasivo,
+        "patrimonio": cierre['equity_social'] + ttm['net_income'],
+        "ventas": ttm['net_sales'], "costo_ventas": ttm['cogs'],
+        "utilidad_bruta": ttm['gross_profit'], "utilidad_op": ttm['operating_income'],
+        "utilidad_neta": ttm['net_income'], "intereses": ttm['interest_expense'],
+        "prom_inv": promedio(cierre['inventory'], inicio['inventory']),
+        "prom_cxc": promedio(cierre['receivables'], inicio['receivables']),
+        "prom_cxp": promedio(cierre['payables'], inicio['payables']),
+        "prom_af": promedio(af, inicio['non_current_assets']),
+        "prom_at": promedio(at, at_inicio),
+    })
+
+def _lista(arr):
+    """Arreglo -> lista JSON (NaN como None: ventana incompleta)"""
+    arr = np.asarray(arr, dtype=float)
+    return [None if np.isnan(x) else float(x) for x in arr]
+
+def _columnar(d):
+    return {k: _columnar(v) if isinstance(v, dict) else _lista(v) for k, v in d.items()}
+
+def analizar_periodos(df, frecuencia='month', meses_ventana=12):
+    """df clasificado con columnas year, month, type, sub_class, value.
+    Devuelve series columnar por periodo: resultados del periodo, TTM, saldos,
+    ratios y flujo de efectivo de la ventana."""
+    m = matriz_periodos(df, frecuencia)
+    ventana = max(1, meses_ventana * FRECUENCIAS[frecuencia] // 12)
+
+    cierre = estados_por_periodo(m)
+    periodo = agregar_resultados({k: cierre[k] for k in FLUJOS})
+    ttm, inicio = ventanas(cierre, ventana)
+    # Los ratios de periodos sin ventana completa quedan como None
+    incompleta = np.isnan(ttm['net_sales'])
+    razones = {k: np.where(incompleta, np.nan, v) for k, v in aplanar(razones_ventana(ttm, cierre, inicio)).items()}
+
+    return {
+        "frequency": frecuencia,
+        "window": ventana,
+        "periods": [str(p) for p in m.index],
+        "income_statement": _columnar(periodo),
+        "ttm": _columnar(ttm),
+        "balances": _columnar({k: v for k, v in cierre.items() if k not in FLUJOS}),
+        "ratios": _columnar(razones),
+        "flujo_efectivo": _columnar(flujo_efectivo_ventana(ttm, cierre, inicio)),
+    }
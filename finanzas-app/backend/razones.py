@@ -0,0 +1,121 @@
+"""Razones financieras sobre arreglos NumPy.
+
+Mismas fórmulas que calcular_ratios_completos, pero cada entrada es un arreglo
+(un elemento por periodo, por empresa, etc.), así que se calcula todo de una vez.
+"""
+from arranque import diferido
+
+np = diferido("numpy")
+
+DIAS_ANIO = 360 # año comercial para días de cobro, inventario y pago
+
+# Rubros del balance por sub-clase: estados, periodos, panel y capital de trabajo usan estos
+GRUPOS_ESTADO = {
+    'ac': ('asset', ['cash', 'receivables', 'inventory', 'current_asset']),
+    'anc': ('asset', ['fixed_asset', 'non_current_asset']),
+    'pc': ('liability', ['payables', 'current_liability']),
+    'pnc': ('liability', ['non_current_liability']),
+}
+SUBS_AC = GRUPOS_ESTADO['ac'][1]
+SUBS_ANC = GRUPOS_ESTADO['anc'][1]
+SUBS_PC = GRUPOS_ESTADO['pc'][1]
+SUBS_PNC = GRUPOS_ESTADO['pnc'][1]
+
+def suma_subclases(m, tipo, subclases=None):
+    """Total de un tipo (o de sus sub-clases) por fila de una matriz con columnas (type, sub_class)"""
+    if tipo not in m.columns.get_level_values('type'):
+        return np.zeros(len(m))
+    bloque = m[tipo]
+    if subclases is not None:
+        bloque = bloque[[s for s in subclases if s in bloque.columns]]
+    return bloque.sum(axis=1).to_numpy(dtype=float)
+
+def total_saldos(s, tipo, subclases=None):
+    """Mismo total sobre los saldos de un año de agregar_saldos ({(type, sub_class): total})"""
+    if subclases is None:
+        return float(sum(v for (t, _), v in s.items() if t == tipo))
+    return float(sum(s.get((tipo, sub), 0.0) for sub in subclases))
+
+def dividir(a, b):
+    """safe_div vectorizado: 0 donde el divisor es 0 (o no es un número)"""
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    validos = (b != 0) & ~np.isnan(b)
+    return np.divide(a, b, out=np.zeros(np.broadcast(a, b).shape), where=validos)
+
+def promedio_o_actual(prom, actual):
+    """Regla de calcular_ratios_completos: si el promedio es 0 se usa el saldo actual, o 1"""
+    return np.where(prom == 0, np.where(actual > 0, actual, 1.0), prom)
+
+def ciclo_efectivo(v, prom_inv, prom_cxc, prom_cxp):
+    """CNO (CxC + inventarios - CxP) y días del ciclo de conversión del efectivo (año de 360)"""
+    dias_inventario = dividir(DIAS_ANIO, dividir(v['costo_ventas'], prom_inv))
+    dias_cobro = dividir(DIAS_ANIO, dividir(v['ventas'], prom_cxc))
+    dias_pago = dividir(DIAS_ANIO, dividir(v['costo_ventas'], prom_cxp))
+    return {
+        "cno": v['cxc'] + v['inv'] - v['cxp'],
+        "dias_inventario": dias_inventario,
+        "dias_cobro": dias_cobro,
+        "dias_pago": dias_pago,
+        "ciclo_conversion": dias_inventario + dias_cobro - dias_pago,
+    }
+
+def calcular_razones(v):
+    """v: dict de arreglos con ac, pc, inv, cxc, cxp, af, at, pasivo, patrimonio, ventas,
+    costo_ventas, utilidad_bruta, utilidad_op, utilidad_neta, intereses y los promedios
+    prom_inv, prom_cxc, prom_cxp, prom_af, prom_at. Devuelve la misma estructura anidada que
+    calcular_ratios_completos, con arreglos en lugar de escalares."""
+    prom_inv = promedio_o_actual(v['prom_inv'], v['inv'])
+    prom_cxc = promedio_o_actual(v['prom_cxc'], v['cxc'])
+    prom_af = promedio_o_actual(v['prom_af'], v['af'])
+    prom_at = promedio_o_actual(v['prom_at'], v['at'])
+    ciclo = ciclo_efectivo(v, prom_inv, prom_cxc, promedio_o_actual(v['prom_cxp'], v['cxp']))
+
+    ventas = v['ventas']
+    dupont_margen = dividir(v['utilidad_neta'], ventas)
+    dupont_rotacion = dividir(ventas, v['at'])
+    dupont_multiplicador = dividir(v['at'], v['patrimonio'])
+
+    return {
+        "liquidez": {
+            "cnt": v['ac'] - v['pc'],
+            "cno": ciclo.pop("cno"),
+            "razon_circulante": dividir(v['ac'], v['pc']),
+            "razon_rapida": dividir(v['ac'] - v['inv'], v['pc'])
+        },
+        "actividad": {
+            "rotacion_inventarios": dividir(v['costo_ventas'], prom_inv),
+            "rotacion_cxc": dividir(ventas, prom_cxc),
+            "periodo_cobro": dividir(DIAS_ANIO, dividir(ventas, prom_cxc)),
+            "rotacion_activos_fijos": dividir(ventas, prom_af),
+            "rotacion_activos_totales": dividir(ventas, prom_at)
+        },
+        "ciclo_efectivo": ciclo,
+        "endeudamiento": {
+            "razon_endeudamiento": dividir(v['pasivo'], v['at']) * 100,
+            "razon_pasivo_capital": dividir(v['pasivo'], v['patrimonio']),
+            "cobertura_intereses": dividir(v['utilidad_op'], v['intereses'])
+        },
+        "rentabilidad": {
+            "margen_bruto": dividir(v['utilidad_bruta'], ventas) * 100,
+            "margen_operativo": dividir(v['utilidad_op'], ventas) * 100,
+            "margen_neto": dividir(v['utilidad_neta'], ventas) * 100,
+            "roa": dividir(v['utilidad_neta'], v['at']) * 100,
+            "roe": dividir(v['utilidad_neta'], v['patrimonio']) * 100,
+            "dupont": {
+                "margen": dupont_margen * 100,
+                "rotacion": dupont_rotacion,
+                "multiplicador": dupont_multiplicador,
+                "sistema": (dupont_margen * dupont_rotacion * dupont_multiplicador) * 100
+            }
+        }
+    }
+
+def aplanar(razones, prefijo=""):
+    """{'liquidez': {'cnt': a}} -> {'liquidez.cnt': a}"""
+    planas = {}
+    for k, v in razones.items():
+        nombre = f"{prefijo}{k}"
+        if isinstance(v, dict): planas.update(aplanar(v, nombre + "."))
+        else: planas[nombre] = v
+    return planas
@@ -0,0 +1,282 @@
+"""Reportes PDF generados en el servidor.
+
+Cada trabajo (job) agrupa una o varias empresas; cada empresa se renderiza en un
+proceso del pool de reportes, así las peticiones de la API solo encolan y consultan.
+Los gráficos se guardan como PNG direccionados por contenido y se reutilizan entre
+reportes con los mismos datos. reportlab y matplotlib se importan solo al renderizar.
+"""
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import arranque
+from cache import huella
+
+REPORT_WORKERS = int(os.environ.get("FINANZAS_REPORT_WORKERS", "2"))
+REPORT_DIR = os.environ.get("FINANZAS_REPORT_DIR", os.path.join(tempfile.gettempdir(), "finanzas-reportes"))
+CHART_DIR = os.path.join(REPORT_DIR, "graficos")
+MAX_JOBS = 500
+
+JOBS = OrderedDict()
+_lock = threading.Lock()
+_pool = None
+_avisos = None # cola por la que los procesos avisan qué empresa empezaron a renderizar
+_escucha = None
+_aviso_proceso = None # la misma cola, dentro de cada proceso del pool
+
+def _iniciar_proceso(cola):
+    global _aviso_proceso
+    _aviso_proceso = cola
+
+def _ejecutar(job_id, company_id, funcion, args):
+    """Corre en el proceso del pool: avisa que la empresa pasó a "running" y la renderiza"""
+    _aviso_proceso.put((job_id, company_id))
+    return funcion(*args)
+
+def _escuchar_avisos(cola):
+    """Hilo del servidor que pasa a "running" las empresas que un proceso tomó.
+    Solo cambia las que siguen "queued": si el resultado llegó antes, no se pisa."""
+    while True:
+        aviso = cola.get()
+        if aviso is None: return
+        job_id, company_id = aviso
+        with _lock:
+            job = JOBS.get(job_id)
+            if job is None: continue
+            empresa = job['companies'][company_id]
+            if empresa['status'] == "queued":
+                empresa['status'] = "running"
+            if job['status'] == "queued":
+                job['status'] = "running"
+
+def obtener_pool_reportes():
+    global _pool, _avisos, _escucha
+    if _pool is None:
+        contexto = arranque.contexto_procesos()
+        _avisos = contexto.SimpleQueue()
+        _escucha = threading.Thread(target=_escuchar_avisos, args=(_avisos,), name="avisos-reportes", daemon=True)
+        _escucha.start()
+        _pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS, mp_context=contexto,
+                                    initializer=_iniciar_proceso, initargs=(_avisos,))
+    return _pool
+
+def cerrar_pool_reportes():
+    global _pool, _avisos, _escucha
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _avisos.put(None)
+        _escucha.join()
+        _pool = _avisos = _escucha = None
+
+# --- TRABAJOS ---
+
+def crear_job(empresas):
+    job_id = uuid.uuid4().hex
+    os.makedirs(os.path.join(REPORT_DIR, job_id), exist_ok=True)
+    with _lock:
+        JOBS[job_id] = {
+            "job_id": job_id,
+            "status": "queued",
+            "created": time.time(),
+            "finished": None,
+            "companies": {cid: {"status": "queued", "error": None} for cid in empresas},
+        }
+        while len(JOBS) > MAX_JOBS:
+            _, viejo = JOBS.popitem(last=False)
+            _borrar_archivos(viejo['job_id'])
+    return job_id
+
+def ruta_pdf(job_id, company_id):
+    return os.path.join(REPORT_DIR, job_id, f"{huella(company_id)[:16]}.pdf")
+
+def encolar(job_id, company_id, funcion, *args):
+    """Envía el render de una empresa al pool. La empresa queda "queued" (desde crear_job)
+    hasta que un proceso la toma; el callback registra "done" o "error" al terminar."""
+    futuro = obtener_pool_reportes().submit(_ejecutar, job_id, company_id, funcion, args)
+
+    def terminado(f):
+        with _lock:
+            job = JOBS.get(job_id)
+            if job is None: return
+            empresa = job['companies'][company_id]
+            error = f.exception()
+            empresa['status'] = "error" if error else "done"
+            empresa['error'] = str(error) if error else None
+            if all(e['status'] in ("done", "error") for e in job['companies'].values()):
+                ok = any(e['status'] == "done" for e in job['companies'].values())
+                job['status'] = "done" if ok else "error"
+                job['finished'] = time.time()
+    futuro.add_done_callback(terminado)
+    return futuro
+
+def estado_job(job_id):
+    with _lock:
+        job = JOBS.get(job_id)
+        if job is None: return None
+        return {**job, "companies": {k: dict(v) for k, v in job['companies'].items()}}
+
+def archivo_job(job_id):
+    """Ruta del PDF (una empresa) o de un ZIP con todos los PDFs generados"""
+    job = estado_job(job_id)
+    listas = [cid for cid, e in job['companies'].items() if e['status'] == "done"]
+    if len(job['companies']) == 1 and listas:
+        return ruta_pdf(job_id, listas[0]), "application/pdf"
+    ruta_zip = os.path.join(REPORT_DIR, job_id, "reportes.zip")
+    if not os.path.exists(ruta_zip):
+        tmp = f"{ruta_zip}.{os.getpid()}.tmp"
+        with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_DEFLATED) as z:
+            for cid in listas:
+                z.write(ruta_pdf(job_id, cid), arcname=f"{cid}.pdf")
+        os.replace(tmp, ruta_zip)
+    return ruta_zip, "application/zip"
+
+def _borrar_archivos(job_id):
+    carpeta = os.path.join(REPORT_DIR, job_id)
+    if not os.path.isdir(carpeta): return
+    for nombre in os.listdir(carpeta):
+        try: os.remove(os.path.join(carpeta, nombre))
+        except OSError: pass
+    try: os.rmdir(carpeta)
+    except OSError: pass
+
+# --- GRÁFICOS ---
+
+def grafico_cacheado(tipo, titulo, etiquetas, series):
+    """PNG de un gráfico de barras ('bar') o líneas ('line'); si ya existe uno con
+    los mismos datos se reutiliza. series: {nombre: [valores]}"""
+    os.makedirs(CHART_DIR, exist_ok=True)
+    ruta = os.path.join(CHART_DIR, huella(tipo, titulo, etiquetas, sorted(series.items())) + ".png")
+    if os.path.exists(ruta): return ruta
+
+    from matplotlib.figure import Figure # la Figure sin pyplot es segura fuera del hilo principal
+    fig = Figure(figsize=(7, 3), dpi=110)
+    ax = fig.add_subplot()
+    x = list(range(len(etiquetas)))
+    if tipo == 'bar':
+        ancho = 0.8 / max(len(series), 1)
+        for i, (nombre, valores) in enumerate(series.items()):
+            ax.bar([p + i * ancho for p in x], valores, width=ancho, label=nombre)
+        ax.set_xticks([p + ancho * (len(series) - 1) / 2 for p in x], etiquetas)
+    else:
+        for nombre, valores in series.items():
+            ax.plot(x, valores, marker='o', label=nombre)
+        ax.set_xticks(x, etiquetas)
+    ax.set_title(titulo, fontsize=10)
+    ax.grid(axis='y', alpha=0.3)
+    ax.legend(fontsize=8)
+    fig.tight_layout()
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    fig.savefig(tmp, format='png')
+    os.replace(tmp, ruta)
+    return ruta
+
+# --- PDF ---
+
+def _fmt(valor):
+    return f"{valor:,.2f}" if isinstance(valor, (int, float)) else str(valor)
+
+def renderizar_pdf(resultado, ruta, titulo):
+    """Escribe el PDF de una empresa a partir de la respuesta completa de /analyze"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Image, PageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    estilos = getSampleStyleSheet()
+    estilo_tabla = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0f172a')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('FONTSIZE', (0, 0), (-1, -1), 8),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ])
+
+    def tabla(encabezado, filas):
+        t = Table([encabezado] + [[f[0]] + [_fmt(v) for v in f[1:]] for f in filas], repeatRows=1)
+        t.setStyle(estilo_tabla)
+        return t
+
+    estados = resultado['financial_statements']
+    years = sorted(estados)
+    etiquetas = [str(y) for y in years]
+    inc = {y: estados[y]['income_statement'] for y in years}
+    bs = {y: estados[y]['balance_sheet'] for y in years}
+
+    elementos = [Paragraph(titulo, estilos['Title'])]
+    for linea in resultado['conclusion'].split("\n"):
+        elementos.append(Paragraph(linea, estilos['Normal']))
+    elementos.append(Spacer(1, 0.4 * cm))
+
+    elementos.append(Paragraph("Estado de Resultados", estilos['Heading2']))
+    conceptos = [("Ventas Netas", 'net_sales'), ("Costo de Ventas", 'cogs'), ("Utilidad Bruta", 'gross_profit'),
+                 ("Gastos Operativos", 'operating_expenses'), ("Depreciación", 'depreciation'),
+                 ("Utilidad Operativa", 'operating_income'), ("Intereses", 'interest_expense'),
+                 ("Impuestos", 'taxes'), ("Utilidad Neta", 'net_income')]
+    elementos.append(tabla(["Concepto"] + etiquetas, [[n] + [inc[y][k] for y in years] for n, k in conceptos]))
+    elementos.append(Image(grafico_cacheado('bar', "Ventas vs Utilidad Neta", etiquetas, {
+        "Ventas": [inc[y]['net_sales'] for y in years],
+        "Utilidad Neta": [inc[y]['net_income'] for y in years],
+    }), width=16 * cm, height=6.8 * cm))
+
+    elementos.append(Paragraph("Balance General", estilos['Heading2']))
+    elementos.append(tabla(["Concepto"] + etiquetas, [
+        ["Activo Corriente"] + [bs[y]['assets']['current']['total'] for y in years],
+        ["Activo No Corriente"] + [bs[y]['assets']['non_current']['total'] for y in years],
+        ["Total Activos"] + [bs[y]['assets']['total'] for y in years],
+        ["Pasivo Corriente"] + [bs[y]['liabilities']['current']['total'] for y in years],
+        ["Pasivo No Corriente"] + [bs[y]['liabilities']['non_current']['total'] for y in years],
+        ["Patrimonio"] + [bs[y]['equity']['total'] for y in years],
+    ]))
+
+    elementos.append(PageBreak())
+    elementos.append(Paragraph("Razones Financieras", estilos['Heading2']))
+    ratios = resultado['ratios']
+    filas_ratios = [
+        ("Razón Circulante", 'liquidez', 'razon_circulante'), ("Razón Rápida", 'liquidez', 'razon_rapida'),
+        ("CNT", 'liquidez', 'cnt'), ("CNO", 'liquidez', 'cno'),
+        ("Rotación Inventarios", 'actividad', 'rotacion_inventarios'),
+        ("Periodo de Cobro", 'actividad', 'periodo_cobro'), ("Ciclo de Conversión (días)", 'ciclo_efectivo', 'ciclo_conversion'),
+        ("Endeudamiento %", 'endeudamiento', 'razon_endeudamiento'),
+        ("Cobertura Intereses", 'endeudamiento', 'cobertura_intereses'), ("Margen Neto %", 'rentabilidad', 'margen_neto'),
+        ("ROA %", 'rentabilidad', 'roa'), ("ROE %", 'rentabilidad', 'roe'),
+    ]
+    elementos.append(tabla(["Razón"] + [str(r['year']) for r in ratios],
+                           [[n] + [r[g][k] for r in ratios] for n, g, k in filas_ratios]))
+    elementos.append(Image(grafico_cacheado('line', "Rentabilidad (%)", [str(r['year']) for r in ratios], {
+        "ROE": [r['rentabilidad']['roe'] for r in ratios],
+        "ROA": [r['rentabilidad']['roa'] for r in ratios],
+        "Margen Neto": [r['rentabilidad']['margen_neto'] for r in ratios],
+    }), width=16 * cm, height=6.8 * cm))
+
+    flujos = resultado['flujo_efectivo']
+    if flujos:
+        elementos.append(Paragraph("Flujo de Efectivo", estilos['Heading2']))
+        elementos.append(tabla(["Concepto"] + [str(f['year']) for f in flujos], [
+            ["Operación (Indirecto)"] + [f['indirecto']['total_operacion'] for f in flujos],
+            ["Inversión"] + [f['indirecto']['total_inversion'] for f in flujos],
+            ["Financiamiento"] + [f['indirecto']['total_financiamiento'] for f in flujos],
+            ["Flujo Neto"] + [f['indirecto']['resumen']['flujo_neto_periodo'] for f in flujos],
+            ["Operación (Directo)"] + [f['directo']['flujo_operativo'] for f in flujos],
+        ]))
+
+    proforma = resultado['proforma']
+    if proforma:
+        elementos.append(Paragraph(f"Proyección {proforma['year_proj']}", estilos['Heading2']))
+        elementos.append(tabla(["Concepto", "Valor"], [
+            ["Crecimiento Ventas %", proforma['growth_rate']],
+            ["Ventas", proforma['proforma']['ventas']],
+            ["Costo de Ventas", proforma['proforma']['costo_ventas']],
+            ["Gastos Operativos", proforma['proforma']['gastos_operativos']],
+            ["Utilidad Operativa", proforma['proforma']['utilidad_operativa']],
+        ]))
+
+    tmp = f"{ruta}.{os.getpid()}.tmp"
+    SimpleDocTemplate(tmp, pagesize=letter, title=titulo).build(elementos)
+    os.replace(tmp, ruta)
+    return ruta
@@ -0,0 +1,76 @@
+"""Formato de respuesta de /analyze: serialización rápida y modo 'slim'.
+
+En modo slim cada línea de cuenta se envía una sola vez en una tabla columnar
+('accounts') y los estados la referencian por posición (account_ids); el análisis
+vertical se reduce a la columna de porcentajes alineada con esa tabla.
+orjson se usa si está instalado; si no, json estándar con separadores compactos.
+"""
+import json
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SECCIONES = ('ratios', 'vertical', 'horizontal', 'flujo_efectivo', 'financial_statements', 'proforma', 'conclusion')
+FORMATOS = ('full', 'slim')
+COLUMNAS_CUENTA = ['id', 'accountName', 'type', 'sub_class', 'year', 'value']
+
+def json_default(o):
+    # Escalares numpy que se cuelan en los resultados
+    if hasattr(o, 'item'): return o.item()
+    return str(o)
+
+def serializar(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=json_default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=json_default, separators=(',', ':')).encode()
+
+def respuesta_json(obj):
+    """Response ya serializada: evita el paso por jsonable_encoder de FastAPI"""
+    return Response(content=serializar(obj), media_type="application/json")
+
+def validar_opciones(response_format, sections):
+    if response_format not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato de respuesta inválido: {response_format}")
+    invalidas = [s for s in sections or [] if s not in SECCIONES]
+    if invalidas:
+        raise HTTPException(status_code=400, detail=f"Secciones inválidas: {', '.join(invalidas)}")
+
+def tabla_cuentas(dfv):
+    """Tabla columnar de cuentas; la posición en las listas es el account_id"""
+    return {col: dfv[col].tolist() for col in COLUMNAS_CUENTA if col in dfv.columns}
+
+def estado_normalizado(stmt, ids):
+    """Copia del estado con listas de posiciones en lugar de las cuentas completas"""
+    bs = stmt['balance_sheet']
+    inc = stmt['income_statement']
+    return {
+        "balance_sheet": {
+            "assets": {
+                "current": {"account_ids": ids.get('ac', []), "total": bs['assets']['current']['total']},
+                "non_current": {"account_ids": ids.get('anc', []), "total": bs['assets']['non_current']['total']},
+                "total": bs['assets']['total']
+            },
+            "liabilities": {
+                "current": {"account_ids": ids.get('pc', []), "total": bs['liabilities']['current']['total']},
+                "non_current": {"account_ids": ids.get('pnc', []), "total": bs['liabilities']['non_current']['total']},
+                "total": bs['liabilities']['total']
+            },
+            "equity": {
+                "account_ids": ids.get('equity', []),
+                "retained_earnings": bs['equity']['retained_earnings'],
+                "total": bs['equity']['total']
+            },
+            "total_liab_equity": bs['total_liab_equity']
+        },
+        "income_statement": {
+            **{k: v for k, v in inc.items() if k not in ('revenues_list', 'expenses_list')},
+            "revenue_ids": ids.get('revenue', []),
+            "expense_ids": ids.get('expense', [])
+        }
+    }